@@ -0,0 +1 @@
+../../../../software/scripts/checksum16.py
\ No newline at end of file
@@ -432,6 +432,10 @@ void process_command(char c) {
     cmd_state = CMD_GET_HEX_LENGTH;
     break;
 
+  case '?':  // readiness probe, host waits for the answer after reset
+    Serial.write('!');
+    break;
+
   case 'e':  // end file
     tx_setup_timer();
     queue_pulse(L_US);    // L/L/L end marker, requires 3 pulses
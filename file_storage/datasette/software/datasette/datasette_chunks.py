@@ -5,14 +5,35 @@ Create chunks type 1 (header), type 2 (basic header), type 3 (payload), and type
 Chunk format: size_low, size_high, type, data...
 
 Creates files: <input_file>.1 (header chunk), <input_file>.20 (payload header), <input_file>.21 (payload data), <input_file>.3 (basic header chunk for type 2 only), <input_file>.4 (checksum chunk)
+or with -i a single tape image <input_file>.dsi holding all chunks (see datasette_image.py)
 
-Usage: create_chunks.py <input_file> <address>
+Usage: create_chunks.py <input_file> <address> [-i]
 Address is given in hex without 0x prefix (e.g., 1000 for 0x1000)
+
+Batch mode builds chunk sets for many files in parallel:
+       create_chunks.py -m <manifest.csv|manifest.toml> [-i] [-o output_dir]
+       create_chunks.py -d <directory> [-i] [-o output_dir]
+CSV manifest lines: path,address[,type[,name]] (optional header line starting with 'path').
+TOML manifest: [[file]] tables with path, address, type and name keys.
+In directory mode file names follow name#TTAAAA convention (as for bintomon.sh),
+TT=06 is runnable, TT=F1 is basic, anything else is data, AAAA is start address.
 """
 
+import os
+import re
 import sys
+import csv
 import argparse
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import tomllib
+except ImportError:  # Python < 3.11
+    tomllib = None
+
+from checksum16 import Checksum16
+from datasette_image import write_tape_image
 
 
 def create_header_chunk(file_type, filename):
@@ -143,26 +164,231 @@ def calculate_checksum(chunks):
     Returns:
         16-bit checksum value
     """
-    checksum = 0
+    checksum = Checksum16()
     for chunk in chunks:
-        for byte in chunk:
-            checksum = (checksum + byte) % 65536
-    return checksum
+        checksum.update(chunk)
+    return checksum.digest()
+
+
+def build_chunks(file_data, file_name, address, file_type):
+    """
+    Create all chunks of a file.
+
+    Args:
+        file_data: content of the input file
+        file_name: name stored in header chunk
+        address: 16-bit start address
+        file_type: 1=runnable, 2=basic, 3=data
+
+    Returns:
+        (parts, checksum) - parts is a list of (suffix, bytes) in tape order,
+        payload chunk is split into header (.20) and data (.21)
+    """
+    header_chunk = create_header_chunk(file_type, file_name)
+
+    if file_type == 2:
+        # For basic files, the first 512 bytes go to basic header
+        if len(file_data) < 512:
+            raise ValueError(f"Basic file must be at least 512 bytes, got {len(file_data)}")
+        basic_header_chunk = create_basic_header_chunk(file_data[:512])
+        payload_data = file_data[512:]
+    else:
+        basic_header_chunk = None
+        payload_data = file_data
+
+    payload_header = create_payload_header(address, len(payload_data))
+
+    parts = [('1', header_chunk), ('20', payload_header), ('21', payload_data)]
+    if basic_header_chunk is not None:
+        parts.append(('3', basic_header_chunk))
+
+    # Calculate checksum on header, payload header, payload data and basic header
+    checksum = calculate_checksum([part for _, part in parts])
+    parts.append(('4', create_checksum_chunk(checksum)))
+    return parts, checksum
+
+
+def write_outputs(parts, base_path, image):
+    """
+    Write chunks as separate files or single tape image.
+
+    Args:
+        parts: (suffix, bytes) list from build_chunks()
+        base_path: output path without extension
+        image: True to create <base_path>.dsi, separate chunk files otherwise
+
+    Returns:
+        list of (path, description) of created files
+    """
+    created = []
+    if image:
+        # Payload header and data are one chunk on tape
+        chunks = [part for suffix, part in parts if suffix != '21']
+        chunks[1] = chunks[1] + parts[2][1]
+        image_output = base_path.with_name(base_path.name + '.dsi')
+        write_tape_image(image_output, chunks)
+        created.append((image_output, f"{len(chunks)} chunks"))
+    else:
+        for suffix, part in parts:
+            output = base_path.with_name(f"{base_path.name}.{suffix}")
+            with open(output, 'wb') as f:
+                f.write(part)
+            created.append((output, f"{len(part)} bytes"))
+    return created
+
+
+def build_entry(entry):
+    """
+    Build and write chunk set for one batch entry, runs in a worker process.
+
+    Args:
+        entry: dict with path, address, type, name, output_dir and image keys
+
+    Returns:
+        list of output lines
+    """
+    input_path = Path(entry['path'])
+    with open(input_path, 'rb') as f:
+        file_data = f.read()
+
+    parts, checksum = build_chunks(file_data, entry['name'][:255], entry['address'], entry['type'])
+    output_dir = Path(entry['output_dir']) if entry['output_dir'] else input_path.parent
+    created = write_outputs(parts, output_dir / entry['name'], entry['image'])
+    return [f"Created {path} ({description})" for path, description in created] + \
+        [f"Checksum: 0x{checksum:04X}"]
+
+
+def read_manifest(filename):
+    """
+    Read batch entries from CSV or TOML manifest.
+
+    Args:
+        filename: manifest path, .toml files are parsed as TOML, anything else as CSV
+
+    Returns:
+        list of dicts with path, address, type and name keys, relative paths
+        are resolved against manifest location
+    """
+    manifest_path = Path(filename)
+    rows = []
+    if manifest_path.suffix.lower() == '.toml':
+        if tomllib is None:
+            raise ValueError("TOML manifests require Python 3.11 or newer")
+        with open(manifest_path, 'rb') as f:
+            for item in tomllib.load(f).get('file', []):
+                rows.append([item['path'], item['address'], item.get('type', 1), item.get('name')])
+    else:
+        with open(manifest_path, newline='') as f:
+            for row in csv.reader(f):
+                row = [value.strip() for value in row]
+                if not row or not row[0] or row[0].startswith('#') or row[0].lower() == 'path':
+                    continue
+                rows.append((row + ['', ''])[:4])
+
+    entries = []
+    for path, address, file_type, name in rows:
+        path = manifest_path.parent / path
+        # TOML integers are taken as they are, strings are hex addresses
+        if isinstance(address, str):
+            address = int(address, 16)
+        file_type = int(file_type) if file_type else 1
+        if not 0 <= address <= 0xFFFF:
+            raise ValueError(f"{path}: address 0x{address:X} out of range")
+        if file_type not in (1, 2, 3):
+            raise ValueError(f"{path}: file type {file_type} is not 1, 2 or 3")
+        entries.append({
+            'path': str(path),
+            'address': address,
+            'type': file_type,
+            'name': name or path.stem,
+        })
+    return entries
+
+
+def scan_directory(dirname):
+    """
+    Find files named name#TTAAAA in a directory.
+
+    Args:
+        dirname: directory to scan
+
+    Returns:
+        list of dicts with path, address, type and name keys
+    """
+    entries = []
+    for path in sorted(Path(dirname).iterdir()):
+        match = re.match(r'^(.+)#([0-9a-fA-F]{2})([0-9a-fA-F]{4})$', path.name)
+        if not path.is_file() or not match:
+            continue
+        prodos_type = int(match.group(2), 16)
+        entries.append({
+            'path': str(path),
+            'address': int(match.group(3), 16),
+            'type': 1 if prodos_type == 0x06 else 2 if prodos_type == 0xF1 else 3,
+            'name': match.group(1),
+        })
+    return entries
+
+
+def run_batch(entries, args):
+    """Build chunk sets for all entries across a process pool"""
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+    for entry in entries:
+        entry['output_dir'] = args.output_dir
+        entry['image'] = args.image
+
+    failed = 0
+    with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+        futures = [pool.submit(build_entry, entry) for entry in entries]
+        for entry, future in zip(entries, futures):
+            try:
+                lines = future.result()
+            except (OSError, ValueError) as e:
+                print(f"Error: {entry['path']}: {e}", file=sys.stderr)
+                failed += 1
+                continue
+            if args.verbose:
+                for line in lines:
+                    print(line)
+            else:
+                print(f"{entry['path']}: {lines[-1]}")
+
+    print(f"Processed {len(entries)} files, {failed} failed")
+    return 1 if failed else 0
 
 
 def main():
     parser = argparse.ArgumentParser(
         description='Create datasette chunks from input file. Creates chunks with separated payload header and data.'
     )
-    parser.add_argument('input_file', help='Input file to process')
-    parser.add_argument('address', type=lambda x: int(x, 16),
+    parser.add_argument('input_file', nargs='?', help='Input file to process')
+    parser.add_argument('address', nargs='?', type=lambda x: int(x, 16),
                         help='Start address in hex without 0x prefix (e.g., 1000 for 0x1000)')
     parser.add_argument('-t', '--type', type=int, choices=[1, 2, 3], default=1,
                         help='File type: 1=runnable, 2=basic, 3=data (default: 1)')
+    parser.add_argument('-i', '--image', action='store_true',
+                        help='Create single tape image <input_file>.dsi instead of separate chunk files')
+    parser.add_argument('-m', '--manifest', help='Batch mode: CSV or TOML manifest of files')
+    parser.add_argument('-d', '--directory', help='Batch mode: all name#TTAAAA files in directory')
+    parser.add_argument('-o', '--output-dir', help='Batch mode: output directory (default: next to input files)')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='Batch mode: number of worker processes (default: number of CPUs)')
     parser.add_argument('-v', '--verbose', action='store_true',
                         help='Verbose output')
     
     args = parser.parse_args()
+
+    if args.manifest or args.directory:
+        try:
+            entries = read_manifest(args.manifest) if args.manifest else scan_directory(args.directory)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Error: Invalid batch input: {e}", file=sys.stderr)
+            return 1
+        return run_batch(entries, args)
+
+    if args.input_file is None or args.address is None:
+        parser.error('input_file and address are required unless --manifest or --directory is given')
     
     # Read input file
     input_path = Path(args.input_file)
@@ -179,121 +405,22 @@ def main():
         print(f"Warning: Filename truncated to 255 characters", file=sys.stderr)
         file_name = file_name[:255]
     
-    # Create output files
-    base_name = input_path.stem
-    # Common files
-    header_output = input_path.parent / f"{base_name}.1"
-    payload_output_1 = input_path.parent / f"{base_name}.20"
-    payload_output_2 = input_path.parent / f"{base_name}.21"
-    checksum_output = input_path.parent / f"{base_name}.4"
-    
-    if args.type == 2:
-        basic_header_output = input_path.parent / f"{base_name}.3"
-    
-    # Create header chunk (type 1)
-    header_chunk = create_header_chunk(args.type, file_name)
-    
+    try:
+        parts, checksum = build_chunks(file_data, file_name, args.address, args.type)
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+
     if args.verbose:
-        print(f"Created header chunk: {len(header_chunk)} bytes")
         print(f"  Type: {args.type} ({'runnable' if args.type == 1 else 'basic' if args.type == 2 else 'data'})")
         print(f"  Name: {file_name}")
-    
-    # Write header chunk to .1 file
-    with open(header_output, 'wb') as f:
-        f.write(header_chunk)
-    
-    if args.type == 2:
-        # For basic files, split the data
-        if len(file_data) < 512:
-            print(f"Error: Basic file must be at least 512 bytes, got {len(file_data)}", file=sys.stderr)
-            return 1
-        
-        basic_header_data = file_data[:512]
-        payload_data = file_data[512:]
-        
-        # Create payload header and data
-        payload_header = create_payload_header(args.address, len(payload_data))
-        payload_data_full = payload_data
-        
-        if args.verbose:
-            print(f"Created payload header: {len(payload_header)} bytes")
-            print(f"  Start address: 0x{args.address:04X}")
-            print(f"  Data length: {len(payload_data_full)} bytes")
-        
-        # Write payload header to .30 and data to .31
-        with open(payload_output_1, 'wb') as f:
-            f.write(payload_header)
-        with open(payload_output_2, 'wb') as f:
-            f.write(payload_data_full)
-        
-        # Create basic header chunk (type 3)
-        basic_header_chunk = create_basic_header_chunk(basic_header_data)
-        
-        if args.verbose:
-            print(f"Created basic header chunk: {len(basic_header_chunk)} bytes")
-            print(f"  Basic header length: {len(basic_header_data)} bytes")
-
-        # Write basic header chunk to .3 file
-        with open(basic_header_output, 'wb') as f:
-            f.write(basic_header_chunk)
-        
-        # Calculate checksum on header, basic header, payload header, and payload data
-        checksum = calculate_checksum([header_chunk, payload_header, payload_data_full, basic_header_chunk])
-        
-        # Create checksum chunk (type 4)
-        checksum_chunk = create_checksum_chunk(checksum)
-        
-        if args.verbose:
-            print(f"Created checksum chunk: {len(checksum_chunk)} bytes")
-            print(f"  Checksum: 0x{checksum:04X} ({checksum})")
-        
-        # Write checksum chunk to .4 file
-        with open(checksum_output, 'wb') as f:
-            f.write(checksum_chunk)
-        
-        print(f"Created {header_output} ({len(header_chunk)} bytes)")
-        print(f"Created {payload_output_1} ({len(payload_header)} bytes)")
-        print(f"Created {payload_output_2} ({len(payload_data_full)} bytes)")
-        print(f"Created {basic_header_output} ({len(basic_header_chunk)} bytes)")
-        print(f"Created {checksum_output} ({len(checksum_chunk)} bytes)")
-        print(f"Checksum: 0x{checksum:04X}")
-        
-    else:
-        # For non-basic files
-        # Create payload header and data
-        payload_header = create_payload_header(args.address, len(file_data))
-        payload_data = file_data
-        
-        if args.verbose:
-            print(f"Created payload header: {len(payload_header)} bytes")
-            print(f"  Start address: 0x{args.address:04X}")
-            print(f"  Data length: {len(payload_data)} bytes")
-        
-        # Write payload header to .20 and data to .21
-        with open(payload_output_1, 'wb') as f:
-            f.write(payload_header)
-        with open(payload_output_2, 'wb') as f:
-            f.write(payload_data)
-        
-        # Calculate checksum on header, payload header, and payload data
-        checksum = calculate_checksum([header_chunk, payload_header, payload_data])
-        
-        # Create checksum chunk (type 4)
-        checksum_chunk = create_checksum_chunk(checksum)
-        
-        if args.verbose:
-            print(f"Created checksum chunk: {len(checksum_chunk)} bytes")
-            print(f"  Checksum: 0x{checksum:04X} ({checksum})")
-        
-        # Write checksum chunk to .4 file
-        with open(checksum_output, 'wb') as f:
-            f.write(checksum_chunk)
-        
-        print(f"Created {header_output} ({len(header_chunk)} bytes)")
-        print(f"Created {payload_output_1} ({len(payload_header)} bytes)")
-        print(f"Created {payload_output_2} ({len(payload_data)} bytes)")
-        print(f"Created {checksum_output} ({len(checksum_chunk)} bytes)")
-        print(f"Checksum: 0x{checksum:04X}")
+        print(f"  Start address: 0x{args.address:04X}")
+        print(f"  Data length: {len(parts[2][1])} bytes")
+        print(f"  Checksum: 0x{checksum:04X} ({checksum})")
+
+    for path, description in write_outputs(parts, input_path.parent / input_path.stem, args.image):
+        print(f"Created {path} ({description})")
+    print(f"Checksum: 0x{checksum:04X}")
     
     return 0
 
@@ -4,9 +4,9 @@ import serial
 import termios
 import tty
 import select
-import time
 import string
 import argparse
+from transport import connect, wait_ready
 
 def kbhit():
     dr, _, _ = select.select([sys.stdin], [], [], 0)
@@ -32,11 +32,11 @@ def main():
 
     try:
         tty.setcbreak(sys.stdin.fileno())
-        ser = serial.Serial(port, 28800, xonxoff=True, timeout=0)
+        ser = connect(port, 28800, xonxoff=True, timeout=0)
         
         # If string argument is provided, send it and exit
         if args.string:
-            time.sleep(2)  # Wait for device to reset and initialize
+            wait_ready(ser, probe=b'?', reply=b'!')  # Wait for device to reset and initialize
             for ch in args.string:
                 ser.write(bytes([ord(ch)]))
                 #time.sleep(0.01)  # Small delay between characters
@@ -0,0 +1,362 @@
+#!/usr/bin/env python3
+"""
+Offline decoder for Datasette logic analyzer captures.
+
+Loads a sigrok session file (.sr) or a raw sample dump, finds edges and pulse
+widths with NumPy in bulk, classifies pulses into S/M/L and runs the same
+marker/bit-pair state machine as the PulseView decoder (pulseview/pd.py).
+Decoded bytes match the 'Bytes' annotation row of pd.py on the same capture.
+
+Usage: datasette_decode.py <capture> [-o output_file] [-c channel] [-a] [--chunks] [--dump]
+Raw dumps need the sample rate, e.g. --samplerate 4M
+"""
+
+import sys
+import re
+import zipfile
+import argparse
+import configparser
+from pathlib import Path
+
+import numpy as np
+
+from datasette_parser import ChunkParser, describe_chunk
+
+# Adaptive thresholds are shared with the PulseView decoder
+sys.path.insert(0, str(Path(__file__).resolve().parent / 'pulseview'))
+from adaptive import AdaptiveThresholds
+
+# Pulse type constants (same as pulseview/pd.py)
+P_S = 0  # Short pulse
+P_M = 1  # Medium pulse
+P_L = 2  # Long pulse
+P_BAD = 3  # Invalid pulse
+
+# Decoder state constants (same as pulseview/pd.py)
+RX_WAIT_MARK_FIRST = 0
+RX_WAIT_MARK_SECOND = 1
+RX_WAIT_MARK_THIRD = 2
+RX_READ_BITS_PAIR_FIRST = 3
+RX_READ_BITS_PAIR_SECOND = 4
+
+
+def parse_samplerate(value):
+    """
+    Parse sample rate string as used by sigrok metadata or command line.
+
+    Args:
+        value: e.g. '4000000', '4M', '4 MHz', '500 kHz'
+
+    Returns:
+        sample rate in Hz (int)
+    """
+    match = re.match(r'^\s*(\d+(?:\.\d+)?)\s*([kmg]?)(?:hz)?\s*$', str(value), re.IGNORECASE)
+    if not match:
+        raise ValueError(f"Invalid sample rate: {value}")
+    scale = {'': 1, 'k': 10**3, 'm': 10**6, 'g': 10**9}[match.group(2).lower()]
+    return int(float(match.group(1)) * scale)
+
+
+def load_sr(filename):
+    """
+    Load logic samples from a sigrok session file (.sr).
+
+    Args:
+        filename: path to .sr file
+
+    Returns:
+        (samples, unitsize, samplerate, probe names)
+    """
+    with zipfile.ZipFile(filename) as zf:
+        metadata = configparser.ConfigParser()
+        metadata.read_string(zf.read('metadata').decode('ascii'))
+        device = metadata['device 1']
+
+        samplerate = parse_samplerate(device['samplerate'])
+        unitsize = int(device.get('unitsize', '1'))
+        capturefile = device.get('capturefile', 'logic-1')
+        total_probes = int(device.get('total probes', '8'))
+        probes = [device.get(f'probe{i + 1}', '') for i in range(total_probes)]
+
+        # Samples are split into numbered parts: logic-1-1, logic-1-2, ...
+        parts = []
+        for name in zf.namelist():
+            if name == capturefile:
+                parts.append((0, name))
+            elif name.startswith(capturefile + '-'):
+                parts.append((int(name[len(capturefile) + 1:]), name))
+        parts.sort()
+        samples = b''.join(zf.read(name) for _, name in parts)
+
+    return samples, unitsize, samplerate, probes
+
+
+def extract_channel(samples, unitsize, channel):
+    """
+    Extract single logic channel from packed samples.
+
+    Args:
+        samples: raw sample bytes, unitsize bytes per sample
+        unitsize: number of bytes per sample
+        channel: channel index, starting from 0
+
+    Returns:
+        NumPy uint8 array of 0/1 values
+    """
+    raw = np.frombuffer(samples, dtype=np.uint8)
+    raw = raw[:len(raw) - len(raw) % unitsize].reshape(-1, unitsize)
+    return (raw[:, channel >> 3] >> (channel & 7)) & 1
+
+
+def find_pulses(bits, polarity='read'):
+    """
+    Find full-cycle pulses as intervals between consecutive start edges.
+
+    Matches pd.py which waits for the start edge, then for the opposite edge and
+    then for the next start edge. Start edge is falling for 'read' polarity and
+    rising for 'write' polarity.
+
+    Args:
+        bits: NumPy array of 0/1 channel values
+        polarity: 'read' or 'write'
+
+    Returns:
+        NumPy int64 array of sample numbers of start edges
+    """
+    step = np.diff(bits.astype(np.int8))
+    edge = 1 if polarity == 'write' else -1
+    return np.flatnonzero(step == edge) + 1
+
+
+def pulse_widths(edges, samplerate):
+    """
+    Calculate full pulse widths in µs, computed the same way as pd.py does.
+
+    Args:
+        edges: sample numbers of start edges
+        samplerate: sample rate in Hz
+
+    Returns:
+        NumPy float64 array, widths[i] is the pulse from edges[i] to edges[i + 1]
+    """
+    return (np.diff(edges) / samplerate) * 1e6
+
+
+def classify_pulses(widths, s_us=390, m_us=540, l_us=700, min_us=150, max_us=1200):
+    """
+    Classify all pulses into S/M/L types in one go.
+
+    Args:
+        widths: pulse widths in µs
+        s_us, m_us, l_us: nominal pulse widths, boundaries are midpoints
+        min_us, max_us: valid pulse width range, glitches are typed P_BAD
+
+    Returns:
+        NumPy uint8 array of pulse types
+    """
+    sm_bound = (s_us + m_us) / 2
+    ml_bound = (m_us + l_us) / 2
+
+    types = np.full(len(widths), P_L, dtype=np.uint8)
+    types[widths < ml_bound] = P_M
+    types[widths < sm_bound] = P_S
+    types[(widths < min_us) | (widths > max_us)] = P_BAD
+    return types
+
+
+def classify_pulses_adaptive(widths, s_us=390, m_us=540, l_us=700, min_us=150, max_us=1200):
+    """
+    Classify pulses with adaptive thresholds, same as pd.py with adaptive=yes.
+
+    Clusters depend on every previous pulse, so this runs pulse by pulse.
+
+    Args:
+        widths: pulse widths in µs
+        s_us, m_us, l_us: nominal pulse widths, starting point for calibration
+        min_us, max_us: valid pulse width range, glitches are typed P_BAD
+
+    Returns:
+        (types, tracker) - NumPy uint8 array of pulse types, AdaptiveThresholds
+    """
+    tracker = AdaptiveThresholds(s_us, m_us, l_us)
+    valid = (widths >= min_us) & (widths <= max_us)
+    types = np.full(len(widths), P_BAD, dtype=np.uint8)
+    indices = np.flatnonzero(valid)
+    types[indices] = [tracker.classify(us) for us in widths[indices].tolist()]
+    return types, tracker
+
+
+def decode_pulses(types, edges):
+    """
+    Run the marker/bit-pair state machine over pulse types.
+
+    Same logic as Decoder.process_pulse in pd.py (and rx_process_pulse in
+    datasette.ino), glitches (P_BAD) reset the state to wait for a marker.
+
+    Args:
+        types: pulse types, types[i] is the pulse from edges[i] to edges[i + 1]
+        edges: sample numbers of start edges
+
+    Returns:
+        dict with 'bytes' (bytearray), 'spans' (list of (start, end) sample numbers
+        per byte), 'eof' (list of (start, end) per end-of-file marker) and 'errors'
+    """
+    data = bytearray()
+    spans = []
+    eof = []
+    errors = 0
+
+    state = RX_WAIT_MARK_FIRST
+    bit_index = 0
+    data_byte = 0
+    first_of_pair = P_BAD
+    byte_start = 0
+
+    starts = edges.tolist()
+    for i, pulse_type in enumerate(types.tolist()):
+        if pulse_type == P_BAD:
+            state = RX_WAIT_MARK_FIRST
+            continue
+
+        if state == RX_WAIT_MARK_FIRST:
+            if pulse_type == P_L:
+                state = RX_WAIT_MARK_SECOND
+                byte_start = starts[i]
+
+        elif state == RX_WAIT_MARK_SECOND:
+            if pulse_type == P_M:
+                bit_index = 0
+                data_byte = 0
+                byte_start = starts[i + 1]
+                state = RX_READ_BITS_PAIR_FIRST
+            elif pulse_type == P_L:
+                state = RX_WAIT_MARK_THIRD
+            else:
+                errors += 1
+                state = RX_WAIT_MARK_FIRST
+
+        elif state == RX_WAIT_MARK_THIRD:
+            if pulse_type == P_L:
+                eof.append((byte_start, starts[i + 1]))
+            else:
+                errors += 1
+            state = RX_WAIT_MARK_FIRST
+
+        elif state == RX_READ_BITS_PAIR_FIRST:
+            if pulse_type == P_S or pulse_type == P_M:
+                first_of_pair = pulse_type
+                state = RX_READ_BITS_PAIR_SECOND
+            else:
+                errors += 1
+                state = RX_WAIT_MARK_FIRST
+
+        else:  # RX_READ_BITS_PAIR_SECOND
+            if ((first_of_pair == P_S and pulse_type == P_M) or
+                (first_of_pair == P_M and pulse_type == P_S)):
+                if first_of_pair == P_M:
+                    data_byte |= (1 << bit_index)  # LSB-first
+                bit_index += 1
+                if bit_index < 8:
+                    state = RX_READ_BITS_PAIR_FIRST
+                else:
+                    data.append(data_byte)
+                    spans.append((byte_start, starts[i + 1]))
+                    state = RX_WAIT_MARK_FIRST
+            else:
+                errors += 1
+                state = RX_WAIT_MARK_FIRST
+
+    return {'bytes': data, 'spans': spans, 'eof': eof, 'errors': errors}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Decode Datasette pulses from a logic analyzer capture (.sr or raw sample dump).'
+    )
+    parser.add_argument('capture', help='Capture file, sigrok session (.sr) or raw samples')
+    parser.add_argument('-o', '--output', help='Write decoded bytes to file')
+    parser.add_argument('-c', '--channel', default='0',
+                        help='Channel index (from 0) or probe name (default: 0)')
+    parser.add_argument('-r', '--samplerate', type=parse_samplerate,
+                        help='Sample rate for raw dumps, e.g. 4M (required for raw dumps)')
+    parser.add_argument('-u', '--unitsize', type=int, default=1,
+                        help='Bytes per sample for raw dumps (default: 1)')
+    parser.add_argument('--polarity', choices=['read', 'write'], default='read',
+                        help='Signal polarity (default: read)')
+    parser.add_argument('--s-us', type=float, default=390, help='Short pulse in µs (default: 390)')
+    parser.add_argument('--m-us', type=float, default=540, help='Medium pulse in µs (default: 540)')
+    parser.add_argument('--l-us', type=float, default=700, help='Long pulse in µs (default: 700)')
+    parser.add_argument('--min-us', type=float, default=150, help='Min valid pulse in µs (default: 150)')
+    parser.add_argument('--max-us', type=float, default=1200, help='Max valid pulse in µs (default: 1200)')
+    parser.add_argument('-a', '--adaptive', action='store_true',
+                        help='Calibrate S/M/L from the sync run and track drift while decoding')
+    parser.add_argument('--chunks', action='store_true', help='List chunks found in decoded data')
+    parser.add_argument('--dump', action='store_true',
+                        help='Print every byte with its sample range, as pd.py annotates it')
+    args = parser.parse_args()
+
+    capture_path = Path(args.capture)
+    if not capture_path.exists():
+        print(f"Error: Capture file '{args.capture}' not found", file=sys.stderr)
+        return 1
+
+    probes = []
+    if zipfile.is_zipfile(capture_path):
+        samples, unitsize, samplerate, probes = load_sr(capture_path)
+    else:
+        if not args.samplerate:
+            print("Error: Sample rate is required for raw dumps (--samplerate)", file=sys.stderr)
+            return 1
+        samples = capture_path.read_bytes()
+        unitsize, samplerate = args.unitsize, args.samplerate
+
+    if args.channel.isdigit():
+        channel = int(args.channel)
+    elif args.channel in probes:
+        channel = probes.index(args.channel)
+    else:
+        print(f"Error: Unknown channel '{args.channel}'", file=sys.stderr)
+        return 1
+    if channel >= unitsize * 8:
+        print(f"Error: Channel {channel} out of range for {unitsize}-byte samples", file=sys.stderr)
+        return 1
+
+    bits = extract_channel(samples, unitsize, channel)
+    edges = find_pulses(bits, args.polarity)
+    widths = pulse_widths(edges, samplerate)
+    thresholds = (args.s_us, args.m_us, args.l_us, args.min_us, args.max_us)
+    if args.adaptive:
+        types, tracker = classify_pulses_adaptive(widths, *thresholds)
+    else:
+        types = classify_pulses(widths, *thresholds)
+    result = decode_pulses(types, edges)
+    data = result['bytes']
+
+    print(f"Samples: {len(bits)} at {samplerate} Hz, pulses: {len(types)}")
+    if args.adaptive:
+        print("Final S/M/L centers (µs): " + '/'.join(f"{us:.0f}" for us in tracker.centers)
+              + ("" if tracker.locked else " (no sync run found)"))
+    print(f"Pulses S/M/L/glitch: " + '/'.join(str(n) for n in np.bincount(types, minlength=4)))
+    print(f"Decoded {len(data)} bytes, {len(result['eof'])} end-of-file marker(s), {result['errors']} error(s)")
+
+    if args.dump:
+        for (start, end), value in zip(result['spans'], data):
+            print(f"{start}-{end} 0x{value:02X} ({value:d})")
+
+    if args.chunks:
+        chunk_parser = ChunkParser()
+        for chunk in chunk_parser.feed(data):
+            print(describe_chunk(chunk))
+        if chunk_parser.buffer:
+            print(f"Incomplete chunk at the end: {len(chunk_parser.buffer)} bytes")
+
+    if args.output:
+        with open(args.output, 'wb') as f:
+            f.write(data)
+        print(f"Created {args.output} ({len(data)} bytes)")
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Datasette tape image - all chunks of a program in one indexed file.
+
+Image format (16-bit and 32-bit values are little endian):
+    0   magic 'DSTI'
+    4   version (1)
+    5   reserved (0)
+    6   number of chunks
+    8   chunk table, 12 bytes per chunk: offset (32-bit), length (32-bit),
+        chunk type, 3 reserved bytes
+    ... chunk bodies, each one exactly as sent with w#### command
+        (size_low, size_high, type, data...)
+
+Chunks are stored in tape order: header, payload, basic header, checksum.
+
+Usage: datasette_image.py <image_file>
+Lists chunks of an image
+"""
+
+import sys
+import mmap
+import struct
+import argparse
+
+MAGIC = b'DSTI'
+VERSION = 1
+IMAGE_HEADER = struct.Struct('<4sBBH')
+TABLE_ENTRY = struct.Struct('<IIB3x')
+
+
+def write_tape_image(filename, chunks):
+    """
+    Write chunks into a tape image.
+
+    Args:
+        filename: output file name
+        chunks: list of complete chunks (bytes-like), in tape order
+    """
+    offset = IMAGE_HEADER.size + TABLE_ENTRY.size * len(chunks)
+    table = bytearray()
+    for chunk in chunks:
+        table.extend(TABLE_ENTRY.pack(offset, len(chunk), chunk[2]))
+        offset += len(chunk)
+
+    with open(filename, 'wb') as f:
+        f.write(IMAGE_HEADER.pack(MAGIC, VERSION, 0, len(chunks)))
+        f.write(table)
+        for chunk in chunks:
+            f.write(chunk)
+
+
+def is_tape_image(filename):
+    """True if file starts with tape image magic"""
+    with open(filename, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+class TapeImage:
+    """
+    Memory-mapped tape image, chunks are served straight from the mapping.
+
+    Usage:
+        with TapeImage('prog.dsi') as image:
+            for chunk in image:
+                ser.write(chunk)
+    """
+
+    def __init__(self, filename):
+        self.file = open(filename, 'rb')
+        try:
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self.file.close()
+            raise ValueError(f"'{filename}' is empty, not a tape image")
+
+        if len(self.map) < IMAGE_HEADER.size:
+            self.close()
+            raise ValueError(f"'{filename}' is not a tape image")
+        magic, version, _, count = IMAGE_HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError(f"'{filename}' is not a version {VERSION} tape image")
+
+        # (offset, length, type) per chunk, first chunk index per type
+        self.entries = []
+        self.by_type = {}
+        for index in range(count):
+            offset, length, chunk_type = TABLE_ENTRY.unpack_from(self.map, IMAGE_HEADER.size + index * TABLE_ENTRY.size)
+            if offset + length > len(self.map):
+                self.close()
+                raise ValueError(f"'{filename}' is truncated, chunk {index} is out of bounds")
+            self.entries.append((offset, length, chunk_type))
+            self.by_type.setdefault(chunk_type, index)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __getitem__(self, index):
+        """Chunk by index as memoryview into the mapping"""
+        offset, length, _ = self.entries[index]
+        return memoryview(self.map)[offset:offset + length]
+
+    def __iter__(self):
+        for index in range(len(self.entries)):
+            yield self[index]
+
+    def find(self, chunk_type):
+        """First chunk of given type or None"""
+        index = self.by_type.get(chunk_type)
+        return None if index is None else self[index]
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='List chunks of a Datasette tape image.')
+    parser.add_argument('image_file', help='Tape image file')
+    args = parser.parse_args()
+
+    try:
+        with TapeImage(args.image_file) as image:
+            for index, (offset, length, chunk_type) in enumerate(image.entries):
+                print(f"Chunk {index}: type {chunk_type}, offset {offset}, length {length}")
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Incremental parser for the chunk stream received from Datasette.
+
+Bytes are fed as they arrive from serial port, complete chunks are returned as
+soon as their last byte is in. Checksum is accumulated chunk by chunk the same
+way as calculate_checksum() in datasette_chunks.py (both use checksum16) and
+checked the moment the type 4 (checksum) chunk arrives. Original binary is
+reconstructed on the fly.
+
+Chunk format: size_low, size_high, type, data...
+
+Usage: datasette_parser.py <capture_file> [-o output_file]
+Parses file saved by datasette_read.py or datasette_decode.py
+"""
+
+import sys
+import argparse
+from collections import namedtuple
+
+from checksum16 import checksum16
+
+CHUNK_HEADER = 1
+CHUNK_PAYLOAD = 2
+CHUNK_BASIC_HEADER = 3
+CHUNK_CHECKSUM = 4
+
+CHUNK_TYPES = {1: 'header', 2: 'payload', 3: 'basic header', 4: 'checksum'}
+FILE_TYPES = {1: 'runnable', 2: 'basic', 3: 'data'}
+
+# offset - position of the chunk in the stream, raw - complete chunk incl. length bytes,
+# checksum - running checksum of the file before this chunk
+Chunk = namedtuple('Chunk', ['offset', 'type', 'raw', 'checksum'])
+
+
+class ChunkParser:
+    """Split byte stream into chunks, verify checksum and collect file content."""
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.offset = 0
+        self.reset()
+
+    def reset(self):
+        """Forget file content, next chunk starts a new file"""
+        self.checksum = 0
+        self.expected_checksum = None
+        self.file_type = None
+        self.name = None
+        self.address = None
+        self.basic_header = bytearray()
+        self.payload = bytearray()
+
+    @property
+    def complete(self):
+        """True once checksum chunk is received"""
+        return self.expected_checksum is not None
+
+    @property
+    def checksum_ok(self):
+        """None until checksum chunk is received, then True or False"""
+        if self.expected_checksum is None:
+            return None
+        return self.expected_checksum == self.checksum
+
+    def feed(self, data):
+        """
+        Consume received bytes.
+
+        Args:
+            data: bytes received so far, any size
+
+        Returns:
+            list of Chunk completed by these bytes
+        """
+        self.buffer.extend(data)
+        chunks = []
+        while len(self.buffer) >= 3:
+            length = self.buffer[0] | (self.buffer[1] << 8)
+            if len(self.buffer) < 2 + length:
+                break
+            raw = bytes(self.buffer[:2 + length])
+            del self.buffer[:2 + length]
+            if self.complete and raw[2] != CHUNK_CHECKSUM:
+                # Previous file is done, this is a new one
+                self.reset()
+            chunk = Chunk(self.offset, raw[2], raw, self.checksum)
+            self.offset += len(raw)
+            self.process_chunk(chunk)
+            chunks.append(chunk)
+        return chunks
+
+    def process_chunk(self, chunk):
+        """Update checksum and file content with a complete chunk"""
+        raw = chunk.raw
+        if chunk.type == CHUNK_CHECKSUM:
+            self.expected_checksum = chunk_checksum(chunk)
+            return
+
+        self.checksum = (self.checksum + checksum16(raw)) & 0xFFFF
+
+        if chunk.type == CHUNK_HEADER:
+            self.file_type = raw[3] if len(raw) > 3 else None
+            self.name = raw[4:].decode('ascii', errors='replace')
+        elif chunk.type == CHUNK_PAYLOAD:
+            if self.address is None and len(raw) >= 5:
+                self.address = raw[3] | (raw[4] << 8)
+            self.payload.extend(raw[5:])
+        elif chunk.type == CHUNK_BASIC_HEADER:
+            self.basic_header.extend(raw[3:])
+
+    def file_data(self):
+        """Reconstruct original binary as given to datasette_chunks.py"""
+        return bytes(self.basic_header + self.payload)
+
+
+def chunk_checksum(chunk):
+    """Checksum value carried by a type 4 chunk, -1 if the chunk is malformed"""
+    raw = chunk.raw
+    return raw[3] | (raw[4] << 8) if len(raw) >= 5 else -1
+
+
+def describe_chunk(chunk):
+    """One line description of a chunk"""
+    raw = chunk.raw
+    length = len(raw) - 2
+    text = f"Chunk @{chunk.offset}: type {chunk.type} ({CHUNK_TYPES.get(chunk.type, 'unknown')}), length {length}"
+    if chunk.type == CHUNK_HEADER and len(raw) > 3:
+        text += f", {FILE_TYPES.get(raw[3], '?')} '{raw[4:].decode('ascii', errors='replace')}'"
+    elif chunk.type == CHUNK_PAYLOAD and len(raw) >= 5:
+        text += f", address 0x{raw[3] | (raw[4] << 8):04X}"
+    elif chunk.type == CHUNK_CHECKSUM:
+        expected = chunk_checksum(chunk)
+        if expected == chunk.checksum:
+            text += f", checksum 0x{expected:04X} OK"
+        else:
+            text += f", checksum 0x{expected & 0xFFFF:04X} MISMATCH, calculated 0x{chunk.checksum:04X}"
+    return text
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Parse chunks from captured Datasette data and verify checksum.')
+    parser.add_argument('capture_file', help='Raw bytes captured by datasette_read.py')
+    parser.add_argument('-o', '--output', help='Write reconstructed original binary to file')
+    args = parser.parse_args()
+
+    try:
+        with open(args.capture_file, 'rb') as f:
+            data = f.read()
+    except FileNotFoundError:
+        print(f"Error: Capture file '{args.capture_file}' not found", file=sys.stderr)
+        return 1
+
+    chunk_parser = ChunkParser()
+    for chunk in chunk_parser.feed(data):
+        print(describe_chunk(chunk))
+    if chunk_parser.buffer:
+        print(f"Incomplete chunk at the end: {len(chunk_parser.buffer)} bytes")
+
+    if args.output:
+        with open(args.output, 'wb') as f:
+            f.write(chunk_parser.file_data())
+        print(f"Created {args.output} ({len(chunk_parser.file_data())} bytes)")
+
+    if not chunk_parser.complete:
+        print("No checksum chunk found")
+        return 1
+    return 0 if chunk_parser.checksum_ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
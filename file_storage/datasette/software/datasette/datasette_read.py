@@ -6,6 +6,8 @@ import tty
 import select
 import time
 import argparse
+from datasette_parser import ChunkParser, CHUNK_CHECKSUM, describe_chunk
+from transport import connect, wait_ready
 
 def kbhit():
     dr, _, _ = select.select([sys.stdin], [], [], 0)
@@ -18,6 +20,9 @@ def main():
     parser = argparse.ArgumentParser(description='Read data from datasette')
     parser.add_argument('filename', help='Output filename')
     parser.add_argument('-p', '--port', default='/dev/ttyS1', help='Serial port (default: /dev/ttyS1)')
+    parser.add_argument('-x', '--extract', help='Write reconstructed original binary to file')
+    parser.add_argument('-k', '--keep-reading', action='store_true',
+                        help='Keep reading after checksum chunk, stop with ESC only')
     
     args = parser.parse_args()
     filename = args.filename
@@ -27,14 +32,15 @@ def main():
 
     try:
         tty.setcbreak(sys.stdin.fileno())
-        ser = serial.Serial(port, 28800, timeout=0)
-        time.sleep(2)  # Wait for device to reset and initialize
+        ser = connect(port, 28800, timeout=0)
+        wait_ready(ser, probe=b'?', reply=b'!')  # Wait for device to reset and initialize
         ser.write(b'r')
 
         print("Press ESC to stop capture.")
 
         last_time = time.time()
         received_this_second = False
+        chunk_parser = ChunkParser()
 
         with open(filename, "wb") as f:
             while True:
@@ -43,6 +49,20 @@ def main():
                     f.write(data)
                     received_this_second = True
 
+                    # Parse chunks as they arrive, verify checksum on the fly
+                    for chunk in chunk_parser.feed(data):
+                        print(f"\n{describe_chunk(chunk)}")
+                        if chunk.type == CHUNK_CHECKSUM and args.extract:
+                            with open(args.extract, "wb") as out:
+                                out.write(chunk_parser.file_data())
+                            print(f"Created {args.extract} ({len(chunk_parser.file_data())} bytes)")
+
+                    if chunk_parser.complete and not args.keep_reading:
+                        # Leave read mode as on ESC
+                        ser.write(b'x')
+                        print("Checksum " + ("OK." if chunk_parser.checksum_ok else "MISMATCH!"))
+                        break
+
                 now = time.time()
                 if now - last_time >= 1.0:
                     if received_this_second:
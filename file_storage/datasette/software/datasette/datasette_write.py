@@ -5,66 +5,158 @@ import os
 import time
 import argparse
 import random
+from datasette_image import TapeImage, is_tape_image
+from transport import connect, wait_ready
+
+# One byte takes 8.4 ms on tape (protocol.txt)
+TAPE_BYTE_MS = 8.4
+# MCU serial FIFO is 64 bytes, keep every write well below it
+BLOCK_SIZE = 32
+# Pace slightly faster than the tape so the pulse buffer never runs dry,
+# XON/XOFF from the MCU absorbs the surplus
+PACE_MARGIN = 1.05
+
+
+class TokenBucket:
+    """Rate limiter, refills rate tokens per second up to capacity tokens"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.last = time.monotonic()
+
+    def consume(self, count):
+        """Wait until count tokens are available and take them"""
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            if self.tokens >= count:
+                self.tokens -= count
+                return
+            time.sleep((count - self.tokens) / self.rate)
+
+
+def send_paced(ser, data, bucket, block_size, flush):
+    """Send data in blocks, each block waits for its tokens"""
+    view = memoryview(data)
+    for offset in range(0, len(view), block_size):
+        block = view[offset:offset + block_size]
+        bucket.consume(len(block))
+        ser.write(block)
+        if flush:
+            ser.flush()
+
+
+def send_delayed(ser, data, args):
+    """Legacy mode: send one byte at a time with fixed delay and optional jitter"""
+    delay_s = args.delay / 1000.0
+    jitter = args.jitter / 1000.0
+
+    for b in data:
+        ser.write(bytes([b]))
+
+        if args.flush:
+            ser.flush()
+
+        # deterministic delay + optional jitter
+        if jitter > 0:
+            d = delay_s + random.uniform(-jitter, jitter)
+            if d < 0:
+                d = 0
+            time.sleep(d)
+        else:
+            time.sleep(delay_s)
+
+
+def send_chunk(ser, data, name, args, bucket):
+    """Send one chunk (bytes or memoryview) with its own write command"""
+    write_cmd = f"sw{len(data):04x}".encode('ascii')
+    ser.write(write_cmd)
+    print(f"Sent write command for '{name}' ({len(data)} bytes)")
+
+    start = time.monotonic()
+    if args.delay is None:
+        send_paced(ser, data, bucket, args.block_size, args.flush)
+    else:
+        send_delayed(ser, data, args)
+    # bytes still in the OS buffer are not on the wire yet
+    ser.flush()
+    elapsed = time.monotonic() - start
+
+    rate = len(data) / elapsed if elapsed > 0 else 0
+    print(f"Sent data for '{name}' in {elapsed:.1f} s ({rate:.1f} bytes/s)")
+    return elapsed
+
 
 def main():
     parser = argparse.ArgumentParser(description='Upload files to datasette (6502-simulated)')
-    parser.add_argument('files', nargs='+', help='Files to upload')
+    parser.add_argument('files', nargs='+', help='Chunk files or tape images (.dsi) to upload')
     parser.add_argument('-p', '--port', default='/dev/ttyS1', help='Serial port (default: /dev/ttyS1)')
-    parser.add_argument('-d', '--delay', type=float, default=10.0,
-                        help='Delay BETWEEN BYTES in milliseconds (default: 1.0 ms)')
+    parser.add_argument('-b', '--block-size', type=int, default=BLOCK_SIZE,
+                        help=f'Bytes per write in paced mode (default: {BLOCK_SIZE}, MCU FIFO is 64)')
+    parser.add_argument('-t', '--byte-time', type=float, default=TAPE_BYTE_MS,
+                        help=f'Tape time of one byte in milliseconds, sets pacing rate (default: {TAPE_BYTE_MS})')
+    parser.add_argument('-d', '--delay', type=float,
+                        help='Legacy mode: delay BETWEEN BYTES in milliseconds instead of paced blocks')
     parser.add_argument('-j', '--jitter', type=float, default=0.0,
-                        help='Random jitter added to delay (+/- value, milliseconds)')
+                        help='Random jitter added to legacy delay (+/- value, milliseconds)')
     parser.add_argument('--flush', action='store_true',
-                        help='Flush after each byte (slow but safest)')
+                        help='Flush after each write (slow but safest)')
     args = parser.parse_args()
 
-    delay_s = args.delay / 1000.0
-    jitter = args.jitter / 1000.0
+    if not 1 <= args.block_size < 64:
+        parser.error("block size must be 1..63")
+    if args.byte_time <= 0:
+        parser.error("byte time must be positive")
 
     filenames = args.files
     port = args.port
 
     try:
-        with serial.Serial(port, 28800, xonxoff=True) as ser:
-            time.sleep(2)
+        with connect(port, 28800, xonxoff=True) as ser:
+            wait_ready(ser, probe=b'?', reply=b'!')  # Wait for device to reset and initialize
             ser.write(b's')
             print("Sent sync command")
 
-            for idx, filename in enumerate(filenames):
+            rate = 1000.0 / args.byte_time * PACE_MARGIN
+            bucket = TokenBucket(rate, args.block_size)
+            total_bytes = 0
+            total_time = 0.0
+
+            idx = 0
+            for filename in filenames:
                 if not os.path.exists(filename):
                     print(f"Error: File '{filename}' not found")
                     continue
 
-                time.sleep(0.5 if idx == 1 else 0.1)
-
-                file_size = os.path.getsize(filename)
-                write_cmd = f"sw{file_size:04x}".encode('ascii')
-                ser.write(write_cmd)
-                print(f"Sent write command for '{filename}' ({file_size} bytes)")
-
-                # send file one byte at a time
-                with open(filename, "rb") as f:
-                    for b in f.read():
-                        ser.write(bytes([b]))
-
-                        if args.flush:
-                            ser.flush()
-
-                        # deterministic delay + optional jitter
-                        if jitter > 0:
-                            d = delay_s + random.uniform(-jitter, jitter)
-                            if d < 0:
-                                d = 0
-                            time.sleep(d)
-                        else:
-                            time.sleep(delay_s)
-
-                print(f"Sent data for '{filename}'")
+                if is_tape_image(filename):
+                    # Stream chunks straight from the memory-mapped image
+                    with TapeImage(filename) as image:
+                        for number, chunk in enumerate(image):
+                            # Released even if sending fails, mapping cannot close while exported
+                            with chunk:
+                                time.sleep(0.5 if idx == 1 else 0.1)
+                                total_time += send_chunk(ser, chunk, f"{filename}#{number}", args, bucket)
+                                total_bytes += len(chunk)
+                            idx += 1
+                else:
+                    time.sleep(0.5 if idx == 1 else 0.1)
+                    with open(filename, "rb") as f:
+                        data = f.read()
+                    total_time += send_chunk(ser, data, filename, args, bucket)
+                    total_bytes += len(data)
+                    idx += 1
 
             ser.write(b'e')
             print("Sent end command")
 
         print("Transfer complete.")
+        if total_time > 0:
+            tape_time = total_bytes * args.byte_time / 1000.0
+            print(f"{total_bytes} bytes in {total_time:.1f} s, {total_bytes / total_time:.1f} bytes/s "
+                  f"(tape time {tape_time:.1f} s, {1000.0 / args.byte_time:.1f} bytes/s)")
 
     except serial.SerialException as e:
         print(f"Serial error: {e}")
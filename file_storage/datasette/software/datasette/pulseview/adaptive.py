@@ -0,0 +1,110 @@
+##
+## This file is part of the libsigrokdecode project.
+##
+## Copyright (C) 2025
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation; either version 2 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with this program; if not, see <http://www.gnu.org/licenses/>.
+##
+
+# Adaptive S/M/L thresholds. Kept free of sigrokdecode imports, so it is
+# shared with the offline decoder (datasette_decode.py).
+
+# Pulse type constants
+P_S = 0  # Short pulse
+P_M = 1  # Medium pulse
+P_L = 2  # Long pulse
+
+
+class AdaptiveThresholds:
+    """
+    Track S/M/L pulse widths with a lightweight online k-means.
+
+    The leading S/S sync run is collected into a histogram, its peak gives the
+    actual S width, M and L are scaled by the same factor. After that every
+    classified pulse pulls its cluster center towards itself, boundaries are
+    kept at midpoints between the centers.
+    """
+
+    def __init__(self, s_us, m_us, l_us, sync_pulses=16, bin_us=8, rate=1 / 32):
+        self.nominal = (s_us, m_us, l_us)
+        self.sync_pulses = sync_pulses
+        self.bin_us = bin_us
+        self.rate = rate
+        self.reset()
+
+    def reset(self):
+        """Go back to nominal widths and wait for a sync run"""
+        self.centers = list(self.nominal)
+        self.histogram = {}
+        self.sync_count = 0
+        self.locked = False
+        self.update_bounds()
+
+    def update_bounds(self):
+        s_us, m_us, l_us = self.centers
+        self.sm_bound = (s_us + m_us) / 2
+        self.ml_bound = (m_us + l_us) / 2
+
+    def classify(self, us):
+        """Classify pulse width into S/M/L types and update clusters"""
+        if us < self.sm_bound:
+            pulse_type = P_S
+        elif us < self.ml_bound:
+            pulse_type = P_M
+        else:
+            pulse_type = P_L
+
+        if self.locked:
+            self.update(pulse_type, us)
+        else:
+            self.calibrate(pulse_type, us)
+        return pulse_type
+
+    def calibrate(self, pulse_type, us):
+        """Collect S/S sync run, lock in S width once it is long enough"""
+        if pulse_type != P_S:
+            # Not a sync run, start over
+            self.histogram = {}
+            self.sync_count = 0
+            return
+
+        index = int(us // self.bin_us)
+        self.histogram[index] = self.histogram.get(index, 0) + 1
+        self.sync_count += 1
+        if self.sync_count < self.sync_pulses:
+            return
+
+        # Peak bin with its neighbours, weighted by bin centers
+        peak = max(self.histogram, key=self.histogram.get)
+        total = 0
+        weighted = 0.0
+        for index in (peak - 1, peak, peak + 1):
+            count = self.histogram.get(index, 0)
+            total += count
+            weighted += count * (index + 0.5) * self.bin_us
+
+        scale = (weighted / total) / self.nominal[P_S]
+        self.centers = [us_nominal * scale for us_nominal in self.nominal]
+        self.update_bounds()
+        self.locked = True
+
+    def update(self, pulse_type, us):
+        """Move cluster center towards the pulse width, keep S < M < L"""
+        center = self.centers[pulse_type] + (us - self.centers[pulse_type]) * self.rate
+        if pulse_type > P_S and center <= self.centers[pulse_type - 1]:
+            return
+        if pulse_type < P_L and center >= self.centers[pulse_type + 1]:
+            return
+        self.centers[pulse_type] = center
+        self.update_bounds()
@@ -11,5 +11,6 @@ echo "Installing Datasette decoder to: $TARGET_DIR"
 mkdir -p "$TARGET_DIR"
 cp "$SCRIPT_DIR/__init__.py" "$TARGET_DIR/"
 cp "$SCRIPT_DIR/pd.py" "$TARGET_DIR/"
+cp "$SCRIPT_DIR/adaptive.py" "$TARGET_DIR/"
 
 echo "Done. Restart PulseView to use the decoder."
@@ -18,6 +18,7 @@
 ##
 
 import sigrokdecode as srd
+from .adaptive import AdaptiveThresholds
 
 # Pulse type constants
 P_S = 0  # Short pulse
@@ -32,6 +33,13 @@ RX_WAIT_MARK_THIRD = 2
 RX_READ_BITS_PAIR_FIRST = 3
 RX_READ_BITS_PAIR_SECOND = 4
 
+# Chunk types, see datasette_chunks.py
+CHUNK_HEADER = 1
+CHUNK_PAYLOAD = 2
+CHUNK_BASIC_HEADER = 3
+CHUNK_CHECKSUM = 4
+FILE_TYPES = {1: 'runnable', 2: 'basic', 3: 'data'}
+
 
 class Decoder(srd.Decoder):
     api_version = 3
@@ -53,6 +61,9 @@ class Decoder(srd.Decoder):
         {'id': 'min_us', 'desc': 'Min valid pulse (µs)', 'default': 150},
         {'id': 'max_us', 'desc': 'Max valid pulse (µs)', 'default': 1200},
         {'id': 'polarity', 'desc': 'Signal polarity', 'default': 'read', 'values': ('read', 'write')},
+        {'id': 'adaptive', 'desc': 'Adaptive thresholds', 'default': 'no', 'values': ('no', 'yes')},
+        {'id': 'annotations', 'desc': 'Annotation level', 'default': 'full',
+            'values': ('full', 'bytes+markers', 'bytes')},
     )
     annotations = (
         ('pulse-s', 'Short pulse'),
@@ -63,6 +74,7 @@ class Decoder(srd.Decoder):
         ('byte', 'Data byte'),
         ('ascii', 'ASCII'),
         ('error', 'Error'),
+        ('chunk', 'Chunk'),
     )
     annotation_rows = (
         ('pulses', 'Pulses', (0, 1, 2)),
@@ -71,6 +83,7 @@ class Decoder(srd.Decoder):
         ('bytes', 'Bytes', (5,)),
         ('ascii', 'ASCII', (6,)),
         ('errors', 'Errors', (7,)),
+        ('chunks', 'Chunks', (8,)),
     )
 
     def __init__(self):
@@ -91,6 +104,9 @@ class Decoder(srd.Decoder):
         self.bit_start = None
         self.pulse_start = None
 
+        # Chunk assembly
+        self.reset_chunks()
+
     def metadata(self, key, value):
         if key == srd.SRD_CONF_SAMPLERATE:
             self.samplerate = value
@@ -108,8 +124,20 @@ class Decoder(srd.Decoder):
         self.min_us = self.options['min_us']
         self.max_us = self.options['max_us']
 
+        # Pulses and bits are the bulk of annotations, skip them unless asked
+        level = self.options['annotations']
+        self.ann_full = level == 'full'
+        self.ann_markers = level != 'bytes'
+
+        # Re-center S/M/L from the sync run and track drift while decoding
+        self.tracker = None
+        if self.options['adaptive'] == 'yes':
+            self.tracker = AdaptiveThresholds(s_us, m_us, l_us)
+
     def classify_pulse(self, us):
         """Classify pulse width into S/M/L types"""
+        if self.tracker:
+            return self.tracker.classify(us)
         if us < self.sm_bound:
             return P_S
         elif us < self.ml_bound:
@@ -126,6 +154,70 @@ class Decoder(srd.Decoder):
         self.byte_start = None
         self.bit_start = None
 
+    def reset_chunks(self):
+        """Forget partial chunk and checksum, next file starts from scratch"""
+        self.chunk = bytearray()
+        self.chunk_start = None
+        self.checksum = 0
+        self.file_started = False
+        self.checksum_valid = True
+
+    def drop_chunk(self, end):
+        """Decoder resyncs after an error: partial chunk is broken, framing starts over"""
+        if self.chunk:
+            self.put(self.chunk_start, end, self.out_ann,
+                     [8, ['Broken chunk: {} bytes'.format(len(self.chunk)), 'Broken', '!']])
+        lost = self.file_started
+        self.reset_chunks()
+        # Bytes of this file may be lost, its checksum cannot be verified
+        self.file_started = lost
+        self.checksum_valid = not lost
+
+    def process_chunk_byte(self, value, start, end):
+        """Collect bytes into chunks: size_low, size_high, type, data..."""
+        if not self.chunk:
+            self.chunk_start = start
+        self.chunk.append(value)
+        self.file_started = True
+        if len(self.chunk) < 3:
+            return
+        length = self.chunk[0] | (self.chunk[1] << 8)
+        if len(self.chunk) < 2 + length:
+            return
+
+        chunk = self.chunk
+        chunk_type = chunk[2]
+        if chunk_type == CHUNK_HEADER and length >= 2:
+            name = chunk[4:].decode('ascii', errors='replace')
+            file_type = FILE_TYPES.get(chunk[3], '?')
+            labels = ['Header: {} ({})'.format(name, file_type), 'H: ' + name, 'H']
+        elif chunk_type == CHUNK_PAYLOAD and length >= 3:
+            address = chunk[3] | (chunk[4] << 8)
+            labels = ['Payload: ${:04X}, {} bytes'.format(address, length - 3),
+                      'P: ${:04X}'.format(address), 'P']
+        elif chunk_type == CHUNK_BASIC_HEADER:
+            labels = ['Basic header: {} bytes'.format(length - 1), 'BH', 'B']
+        elif chunk_type == CHUNK_CHECKSUM and length >= 3:
+            expected = chunk[3] | (chunk[4] << 8)
+            if not self.checksum_valid:
+                status = 'not verified, bytes lost'
+            else:
+                status = 'OK' if expected == self.checksum else 'mismatch ${:04X}'.format(self.checksum)
+            labels = ['Checksum: ${:04X} {}'.format(expected, status),
+                      'C: ${:04X}'.format(expected), 'C']
+        else:
+            labels = ['Chunk type {}: {} bytes'.format(chunk_type, length), '?']
+        self.put(self.chunk_start, end, self.out_ann, [8, labels])
+
+        # Checksum covers all chunks except checksum itself
+        if chunk_type == CHUNK_CHECKSUM:
+            self.reset_chunks()
+            return
+        else:
+            self.checksum = (self.checksum + sum(chunk)) & 0xFFFF
+        self.chunk = bytearray()
+        self.chunk_start = None
+
     def process_pulse(self, pulse_type, start, end):
         """Process a single pulse - same logic as rx_process_pulse"""
         
@@ -138,7 +230,8 @@ class Decoder(srd.Decoder):
         elif self.state == RX_WAIT_MARK_SECOND:
             if pulse_type == P_M:
                 # Marker L/M confirmed: start new byte
-                self.put(self.byte_start, end, self.out_ann, [3, ['MARK', 'M']])
+                if self.ann_markers:
+                    self.put(self.byte_start, end, self.out_ann, [3, ['MARK', 'M']])
                 self.bit_index = 0
                 self.data_byte = 0
                 self.byte_start = end
@@ -150,16 +243,20 @@ class Decoder(srd.Decoder):
                 # Not M next, restart
                 self.put(self.byte_start, end, self.out_ann, [7, ['Bad marker', 'ERR']])
                 self.reset_to_marker()
+                self.drop_chunk(end)
 
         elif self.state == RX_WAIT_MARK_THIRD:
             if pulse_type == P_L:
                 # End of data marker (L/L/L)
-                self.put(self.byte_start, end, self.out_ann, [3, ['EOF', 'E']])
+                if self.ann_markers:
+                    self.put(self.byte_start, end, self.out_ann, [3, ['EOF', 'E']])
                 self.reset_to_marker()
+                self.reset_chunks()
             else:
                 # Not L next, restart
                 self.put(self.byte_start, end, self.out_ann, [7, ['Bad marker', 'ERR']])
                 self.reset_to_marker()
+                self.drop_chunk(end)
                 
         elif self.state == RX_READ_BITS_PAIR_FIRST:
             # Only S or M are valid for first of data-bit pair
@@ -171,6 +268,7 @@ class Decoder(srd.Decoder):
                 # Unexpected (L), resync
                 self.put(start, end, self.out_ann, [7, ['Bad bit start', 'ERR']])
                 self.reset_to_marker()
+                self.drop_chunk(end)
                 
         elif self.state == RX_READ_BITS_PAIR_SECOND:
             # Expect complement: S/M=0 or M/S=1
@@ -178,7 +276,8 @@ class Decoder(srd.Decoder):
                 (self.first_of_pair == P_M and pulse_type == P_S)):
                 
                 bit = 1 if self.first_of_pair == P_M else 0
-                self.put(self.bit_start, end, self.out_ann, [4, [str(bit)]])
+                if self.ann_full:
+                    self.put(self.bit_start, end, self.out_ann, [4, [str(bit)]])
                 
                 if bit:
                     self.data_byte |= (1 << self.bit_index)  # LSB-first
@@ -192,11 +291,14 @@ class Decoder(srd.Decoder):
                     self.put(self.byte_start, end, self.out_ann, [5, [byte_str, '{:02X}'.format(self.data_byte)]])
                     
                     # ASCII representation
-                    if 32 <= self.data_byte <= 126:
-                        ascii_char = chr(self.data_byte)
-                    else:
-                        ascii_char = '.'
-                    self.put(self.byte_start, end, self.out_ann, [6, [ascii_char]])
+                    if self.ann_full:
+                        if 32 <= self.data_byte <= 126:
+                            ascii_char = chr(self.data_byte)
+                        else:
+                            ascii_char = '.'
+                        self.put(self.byte_start, end, self.out_ann, [6, [ascii_char]])
+
+                    self.process_chunk_byte(self.data_byte, self.byte_start, end)
                     
                     # After a byte, expect another L/M marker
                     self.reset_to_marker()
@@ -205,6 +307,7 @@ class Decoder(srd.Decoder):
                 # Invalid pair, resync
                 self.put(self.bit_start, end, self.out_ann, [7, ['Bad bit pair', 'ERR']])
                 self.reset_to_marker()
+                self.drop_chunk(end)
 
     def decode(self):
         if not self.samplerate:
@@ -238,6 +341,7 @@ class Decoder(srd.Decoder):
                     self.put(pulse_start, pulse_end, self.out_ann, 
                             [7, ['Glitch {:.0f}µs'.format(pulse_us), 'GLITCH']])
                 self.reset_to_marker()
+                self.drop_chunk(pulse_end)
                 pulse_start = pulse_end
                 continue
             
@@ -245,10 +349,11 @@ class Decoder(srd.Decoder):
             pulse_type = self.classify_pulse(pulse_us)
             
             # Annotate pulse type
-            pulse_labels = ['S', 'M', 'L', 'BAD']
-            pulse_label = pulse_labels[pulse_type]
-            self.put(pulse_start, pulse_end, self.out_ann,
-                    [pulse_type, [pulse_label]])
+            if self.ann_full:
+                pulse_labels = ['S', 'M', 'L', 'BAD']
+                pulse_label = pulse_labels[pulse_type]
+                self.put(pulse_start, pulse_end, self.out_ann,
+                        [pulse_type, [pulse_label]])
             
             # Process the pulse
             self.process_pulse(pulse_type, pulse_start, pulse_end)
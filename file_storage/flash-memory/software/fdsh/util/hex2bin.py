@@ -1,66 +1,128 @@
 #!/usr/bin/python3
 
-import sys
+# Convert test vectors (.hex) to binary (.hex.bin). Tokens are hex bytes or
+# characters ('a'), "BYTE:" and "NIBBLE:" switch mode - in NIBBLE mode every
+# byte is sent as two DATA-flagged nibbles (0x10 + nibble), MSN first.
+#
+# Usage: hex2bin.py [--check] <file.hex | directory> ...
+
+import os
 import re
+import sys
+import argparse
+from nibble import encode
 
-def hex_to_bin(filename):
-    try:
-        with open(filename, 'r') as infile:
-            lines = infile.readlines()
-
-        output_filename = filename + '.bin'
-        binary_data = bytearray()
-        nibble = False
-
-        for line in lines:
-            # Remove comments (text after ';') and whitespace
-            line = re.sub(r';.*', '', line).strip()
-            
-            # Skip empty lines
-            if not line:
-                continue
-
-            # Split line into tokens
-            tokens = line.split()
-            for token in tokens:
-                # Set mode
-                if token == "NIBBLE:":
-                    nibble = True
-                elif token == "BYTE:":
-                    nibble = False
-                elif token.startswith("'") and token.endswith("'") and len(token) == 3:
-                    # Handle character values (e.g., 'a')
-                    char_value = ord(token[1])
-                    if nibble:
-                        binary_data.append(0x10+((char_value & 0xF0) >> 4))  # MS nibble
-                        binary_data.append(0x10+(char_value & 0x0F))          # LS nibble
-                    else:
-                        binary_data.append(char_value)
+COMMENT = re.compile(r';.*')
+
+NIBBLES = [encode(bytes([value])) for value in range(256)]
+BYTES = [bytes([value]) for value in range(256)]
+
+# Token cache: hex and character tokens seen so far, pre-filled with two-digit hex
+TOKENS = {}
+for value in range(256):
+    TOKENS[f"{value:02x}"] = TOKENS[f"{value:02X}"] = TOKENS[f"{value:x}"] = TOKENS[f"{value:X}"] = value
+
+
+def token_value(token):
+    """Value of a token, None if token is invalid"""
+    value = TOKENS.get(token)
+    if value is None:
+        if token.startswith("'") and token.endswith("'") and len(token) == 3:
+            # Handle character values (e.g., 'a')
+            value = ord(token[1])
+        else:
+            try:
+                # Parse as hexadecimal
+                value = int(token, 16)
+            except ValueError:
+                return None
+        TOKENS[token] = value
+    return value
+
+
+def convert(lines):
+    """
+    Convert lines of a test vector.
+
+    Returns:
+        (binary data, list of invalid tokens)
+    """
+    binary_data = bytearray()
+    invalid = []
+    table = BYTES
+    for line in lines:
+        # Remove comments (text after ';'), split line into tokens
+        for token in COMMENT.sub('', line).split():
+            # Set mode
+            if token == "NIBBLE:":
+                table = NIBBLES
+            elif token == "BYTE:":
+                table = BYTES
+            else:
+                value = token_value(token)
+                if value is None or (table is BYTES and not 0 <= value <= 0xFF):
+                    invalid.append(token)
                 else:
-                    try:
-                        # Parse as hexadecimal
-                        byte_value = int(token, 16)
-                        if nibble:
-                            binary_data.append(0x10+((byte_value & 0xF0) >> 4))  # MS nibble
-                            binary_data.append(0x10+(byte_value & 0x0F))          # LS nibble
-                        else:
-                            binary_data.append(byte_value)
-                    except ValueError:
-                        print(f"Skipping invalid token: {token}")
-
-        with open(output_filename, 'wb') as outfile:
-            outfile.write(binary_data)
-
-        print(f"Binary file written to {output_filename}")
+                    binary_data += table[value & 0xFF]
+    return binary_data, invalid
+
+
+def hex_to_bin(filename, check=False):
+    """
+    Convert file to filename.bin, the file is written only if its content changes.
 
+    Args:
+        check: compare with existing filename.bin only, do not write it
+
+    Returns:
+        True if filename.bin is (or was already) up to date
+    """
+    output_filename = filename + '.bin'
+    try:
+        with open(filename, 'r') as infile:
+            binary_data, invalid = convert(infile)
     except FileNotFoundError:
         print(f"Error: File {filename} not found.")
-    except Exception as e:
-        print(f"An error occurred: {e}")
+        return False
+    for token in invalid:
+        print(f"Skipping invalid token: {token}")
 
-if __name__ == "__main__":
-    if len(sys.argv) != 2:
-        print("Usage: python script.py <filename>")
-    else:
-        hex_to_bin(sys.argv[1])
+    try:
+        with open(output_filename, 'rb') as f:
+            current = f.read()
+    except FileNotFoundError:
+        current = None
+    if current == binary_data:
+        print(f"Binary file {output_filename} is up to date")
+        return True
+    if check:
+        print(f"Binary file {output_filename} {'is missing' if current is None else 'differs'}")
+        return False
+
+    with open(output_filename, 'wb') as outfile:
+        outfile.write(binary_data)
+    print(f"Binary file written to {output_filename}")
+    return True
 
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert test vectors (.hex) to binary (.hex.bin).")
+    parser.add_argument("paths", nargs="+", help="Test vector files, or directories to convert all .hex files in")
+    parser.add_argument("--check", action="store_true", help="Only compare with existing .bin files, exit status 1 if any differs")
+    args = parser.parse_args()
+
+    filenames = []
+    for path in args.paths:
+        if os.path.isdir(path):
+            filenames += sorted(os.path.join(path, name) for name in os.listdir(path) if name.endswith(".hex"))
+        else:
+            filenames.append(path)
+
+    ok = True
+    for filename in filenames:
+        ok = hex_to_bin(filename, args.check) and ok
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1 @@
+../../utils/nibble.py
\ No newline at end of file
@@ -0,0 +1,500 @@
+#########################################################
+# Bulk operations utility for Flash Disk storage device
+# Copyright (c) 2025 Arvid Juskaitis
+#
+# Serial protocol helpers shared by bulk_*.py scripts, see README.md
+
+import serial
+import struct
+import time
+import hashlib
+import json
+import os
+import zlib
+from transport import connect, wait_ready, SOCKET_PREFIX
+
+PAGE_SIZE = 256
+BLOCK_SIZE = 32768
+PAGES_PER_BLOCK = BLOCK_SIZE // PAGE_SIZE
+MAX_BLOCKS = 256
+
+ACK = b'\xA0'
+NACK = b'\xAF'
+
+# W25Q64 32 KB block erase takes 1.6 s at most
+ERASE_TIME_PER_BLOCK = 2
+
+# sizeof(FileEntry_t), header at the beginning of every block
+HEADER_SIZE = 32
+
+# Directory cache and erase generations
+CACHE_DIR = os.path.join(os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")), "rc6502-flash")
+
+
+def open_port(port, baudrate, timeout, quiet=False):
+    """
+    Open serial port, wait for the device to come up and print its banner.
+
+    Args:
+        quiet: print errors only
+
+    Returns:
+        serial.Serial or None if port cannot be opened
+    """
+    try:
+        ser = connect(
+            port=port,
+            baudrate=baudrate,
+            bytesize=serial.EIGHTBITS,
+            parity=serial.PARITY_NONE,
+            stopbits=serial.STOPBITS_ONE,
+            timeout=timeout
+        )
+    except serial.SerialException as e:
+        print(f"Error opening serial port: {e}")
+        return None
+
+    # Board resets on open, transfer starts as soon as its banner is complete
+    initial_data = wait_ready(ser)
+    if quiet:
+        return ser
+
+    print(f"Serial port {port} opened at {baudrate} baud.")
+    print("Receiving initial output from the device...")
+    if initial_data:
+        print("Initial data received:")
+        print(initial_data.decode('utf-8', errors='replace'))  # Decode and print
+    else:
+        print("No initial data received.")
+    return ser
+
+
+class Progress:
+    """
+    Progress meter on one terminal line, redrawn at most every interval seconds.
+
+    Usage:
+        progress = Progress(total, quiet=args.quiet)    # total None if not known
+        progress.update(done)
+        progress.finish(done)
+    """
+
+    def __init__(self, total, label="Read", quiet=False, interval=0.5):
+        self.total = total
+        self.label = label
+        self.quiet = quiet
+        self.interval = interval
+        self.start = time.monotonic()
+        self.last = 0
+
+    def elapsed(self):
+        return time.monotonic() - self.start
+
+    def update(self, done):
+        now = time.monotonic()
+        if self.quiet or now - self.last < self.interval:
+            return
+        self.last = now
+        print(f"\r{self.line(done)}", end="", flush=True)
+
+    def line(self, done):
+        elapsed = self.elapsed()
+        rate = done / elapsed if elapsed > 0 else 0
+        if self.total is None:
+            # Size not known in advance
+            return f"{self.label} {done // 1024} KB  {rate / 1024:6.1f} KB/s".ljust(64)
+        text = f"{self.label} {done // 1024}/{self.total // 1024} KB {100 * done // max(self.total, 1):3d}%  {rate / 1024:6.1f} KB/s"
+        if rate > 0 and done < self.total:
+            eta = (self.total - done) / rate
+            text += f"  ETA {int(eta) // 60}:{int(eta) % 60:02d}"
+        return text.ljust(64)
+
+    def finish(self, done):
+        if not self.quiet:
+            print(f"\r{self.line(done)}")
+
+
+def read_into(ser, buffer, progress=None, base=0, chunk_size=4096):
+    """
+    Fill buffer (bytearray, memoryview, mmap) from serial port.
+
+    Args:
+        progress: Progress updated with base + bytes read so far
+
+    Returns:
+        number of bytes read, less than buffer size if device stopped sending
+    """
+    view = memoryview(buffer)
+    total = 0
+    try:
+        while total < len(view):
+            count = ser.readinto(view[total:total + chunk_size])
+            if not count:  # No data received
+                break
+            total += count
+            if progress is not None:
+                progress.update(base + total)
+    finally:
+        view.release()
+    return total
+
+
+def drain(ser, quiet_time=0.5):
+    """Discard responses until the device stays silent for quiet_time seconds"""
+    ser.flush()
+    timeout = ser.timeout
+    ser.timeout = quiet_time
+    try:
+        while ser.read(256):
+            pass
+    finally:
+        ser.timeout = timeout
+
+
+def send_write_command(ser, offs, pages):
+    """Send the "W" command with the offs, size, both in pages"""
+    offs_pack = struct.pack("<H", offs) # Little-endian 2-byte offs
+    pages_pack = struct.pack("<H", pages)  # Little-endian 2-byte size
+    ser.write(b"W" + offs_pack + pages_pack)
+    print(f"Sent command 'W' {offs_pack}, {pages_pack}.")
+
+
+def write_pages(ser, data, offs, window=1, retries=3, on_ack=None):
+    """
+    Stream pages to device, keeping up to window pages in flight.
+
+    Responses come in page order, so n-th ACK/NACK after the "W" command
+    belongs to n-th page sent. With window 1, a new "W" command retransmits
+    the failed page. With more pages in flight the device takes them for data
+    after NACK, so transmission fails and resume writes the block again.
+
+    Args:
+        ser: open serial port
+        data: bytes-like, size multiple of 256
+        offs: device page the first page is written to
+        window: number of pages sent ahead of ACK, 1 waits for each ACK
+        retries: number of times a single page may be retransmitted, window 1 only
+        on_ack: called with page index in data when the page is acknowledged
+
+    Returns:
+        True if all pages were acknowledged
+    """
+    view = memoryview(data)
+    pages = len(view) // PAGE_SIZE
+    start = 0
+    failures = {}
+    while start < pages:
+        send_write_command(ser, offs + start, pages - start)
+
+        sent = acked = start
+        failed = None
+        while acked < pages:
+            # Fill the window
+            while sent < pages and sent - acked < window:
+                ser.write(view[sent * PAGE_SIZE:(sent + 1) * PAGE_SIZE])
+                sent += 1
+
+            # Wait for ACK or NACK of the oldest page in flight
+            ack = ser.read(1)  # Read 1 byte
+            if not ack:
+                print("Error: No response received. Terminating transmission.")
+                return False
+
+            if ack == ACK:
+                acked += 1
+                print(f"Page {acked}/{pages} acknowledged.")
+                if on_ack is not None:
+                    on_ack(acked - 1)
+            elif ack == NACK:
+                failed = acked
+                break
+            else:
+                print(f"Unexpected response: {ack}. Terminating transmission.")
+                return False
+
+        if failed is None:
+            break
+
+        if window > 1:
+            print(f"Page {failed + 1}/{pages} rejected, {sent - failed - 1} pages in flight. Terminating transmission.")
+            drain(ser)
+            return False
+
+        failures[failed] = failures.get(failed, 0) + 1
+        if failures[failed] > retries:
+            print(f"Page {failed + 1}/{pages} rejected {failures[failed]} times. Terminating transmission.")
+            return False
+        print(f"Page {failed + 1}/{pages} rejected, {sent - failed - 1} pages in flight dropped. Retransmitting...")
+        drain(ser)
+        start = failed
+
+    return True
+
+
+def send_read_command(ser, offs, pages, quiet=False, extended=False):
+    """
+    Send "R" command, or with extended, "r" command if reading does not start at page 0.
+
+    "R" <pages> reads from the beginning of flash, so pages before offs are sent
+    as well and the caller skips them. "r" <offs> <pages> reads from given page,
+    it needs firmware supporting it (see README.md).
+
+    Returns:
+        number of bytes to skip before page offs
+    """
+    if offs == 0 or not extended:
+        total = offs + pages if pages else 0
+        pages_pack = struct.pack("<H", total if total <= 0xFFFF else 0)  # Little-endian 2-byte size
+        ser.write(b"R" + pages_pack)
+        if not quiet:
+            print(f"Sent command 'R' {pages_pack}.")
+        return offs * PAGE_SIZE
+    offs_pack = struct.pack("<H", offs)
+    pages_pack = struct.pack("<H", pages)
+    ser.write(b"r" + offs_pack + pages_pack)
+    if not quiet:
+        print(f"Sent command 'r' {offs_pack}, {pages_pack}.")
+    return 0
+
+
+def skip_bytes(ser, count):
+    """
+    Read and discard count bytes, e.g. pages sent by "R" before the requested ones.
+
+    Returns:
+        True if all bytes arrived
+    """
+    buffer = bytearray(min(count, BLOCK_SIZE))
+    while count > 0:
+        size = min(count, len(buffer))
+        with memoryview(buffer)[:size] as view:
+            if read_into(ser, view) < size:
+                return False
+        count -= size
+    return True
+
+
+def read_pages(ser, offs, pages, extended=False):
+    """
+    Read pages from device.
+
+    Returns:
+        bytes, shorter than requested if device stopped sending
+    """
+    if not skip_bytes(ser, send_read_command(ser, offs, pages, extended=extended)):
+        return b''
+    data = bytearray(pages * PAGE_SIZE)
+    count = read_into(ser, data)
+    return bytes(data[:count])
+
+
+def send_erase_command(ser, first, blocks):
+    """
+    Send "E" command, or extended "e" command if erasing does not start at block 0.
+
+    "E" <blocks> erases from the beginning of flash, "e" <first> <blocks> erases from
+    given block, it needs firmware supporting it (see README.md).
+    """
+    blocks_pack = struct.pack("<H", blocks)  # Little-endian 2-byte size
+    if first == 0:
+        ser.write(b"E" + blocks_pack)
+        print(f"Sent command 'E' {blocks_pack}.")
+    else:
+        first_pack = struct.pack("<H", first)
+        ser.write(b"e" + first_pack + blocks_pack)
+        print(f"Sent command 'e' {first_pack}, {blocks_pack}.")
+
+
+def erase_blocks(ser, first, blocks, extended=False):
+    """
+    Erase blocks and wait for ACK. Erasing from block other than 0 needs extended
+    "e" command, without extended it is refused.
+
+    Returns:
+        True if device acknowledged
+    """
+    if first and not extended:
+        print(f"Error: Erasing from block {first} needs extended \"e\" command (see README.md).")
+        return False
+    send_erase_command(ser, first, blocks)
+    timeout = ser.timeout
+    if timeout is not None:
+        ser.timeout = max(timeout, (blocks or MAX_BLOCKS) * ERASE_TIME_PER_BLOCK)
+    try:
+        response = ser.read(1)
+    finally:
+        ser.timeout = timeout
+
+    if not response:
+        print("Error: No response received. Timeout occurred.")
+    elif response == NACK:
+        print("NACK received. Erase failed.")
+    elif response != ACK:
+        print(f"Unexpected response: {response}")
+    return response == ACK
+
+
+def send_headers_command(ser, first, blocks):
+    """Send extended "h" command, it needs firmware supporting it (see README.md)"""
+    first_pack = struct.pack("<H", first)
+    blocks_pack = struct.pack("<H", blocks)
+    ser.write(b"h" + first_pack + blocks_pack)
+    print(f"Sent command 'h' {first_pack}, {blocks_pack}.")
+
+
+def read_headers(ser, first, blocks):
+    """
+    Read file entry header (first 32 bytes) of every block.
+
+    Returns:
+        bytes, 32 bytes per block, shorter than requested if device stopped sending
+    """
+    send_headers_command(ser, first, blocks)
+    size = blocks * HEADER_SIZE
+    data = bytearray()
+    while len(data) < size:
+        chunk = ser.read(size - len(data))
+        if not chunk:  # No data received
+            break
+        data.extend(chunk)
+    return bytes(data)
+
+
+def device_id(port):
+    """
+    Identify device behind the port, USB serial number if known, so the same
+    adapter gets the same id on another port.
+    """
+    if port.startswith(SOCKET_PREFIX):
+        return port
+    path = os.path.realpath(port)
+    try:
+        from serial.tools import list_ports
+        for info in list_ports.comports():
+            if os.path.realpath(info.device) == path and info.serial_number:
+                return f"usb:{info.vid:04x}:{info.pid:04x}:{info.serial_number}"
+    except ImportError:
+        pass
+    return path
+
+
+def _generations_file():
+    return os.path.join(CACHE_DIR, "generations.json")
+
+
+def _load_generations():
+    try:
+        with open(_generations_file()) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def erase_generation(port):
+    """Counter bumped every time bulk tools modify the device"""
+    return _load_generations().get(device_id(port), 0)
+
+
+def bump_erase_generation(port):
+    """Mark device content as changed, cached directory becomes stale"""
+    generations = _load_generations()
+    key = device_id(port)
+    generations[key] = generations.get(key, 0) + 1
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    with open(_generations_file(), "w") as f:
+        json.dump(generations, f, indent=1)
+
+
+class BlockJournal:
+    """
+    Sidecar journal of completed 32 kb blocks, makes transfers resumable.
+
+    First line identifies the transfer (direction, range, size), journal of
+    another transfer is ignored. Every following line is block index within
+    the transfer and CRC-32 of its data, appended as soon as the block is done.
+
+    Usage:
+        journal = BlockJournal(filename + ".journal", f"read 0 {blocks}")
+        done = journal.load()       # {index: crc}, when resuming
+        journal.open(done)
+        journal.record(index, block_data)
+        journal.remove()            # transfer complete
+    """
+
+    def __init__(self, filename, transfer):
+        self.filename = filename
+        self.transfer = transfer
+        self.file = None
+
+    def load(self):
+        """Completed blocks of the same transfer, {index: crc}"""
+        try:
+            with open(self.filename) as f:
+                lines = f.read().splitlines()
+        except FileNotFoundError:
+            return {}
+        if not lines or lines[0] != self.transfer:
+            return {}
+        done = {}
+        for line in lines[1:]:
+            try:
+                index, crc = line.split()
+                done[int(index)] = int(crc, 16)
+            except ValueError:
+                break  # Last line written partially
+        return done
+
+    def open(self, done=None):
+        """Start new journal, keeping blocks in done"""
+        self.file = open(self.filename, "w")
+        self.file.write(self.transfer + "\n")
+        for index in sorted(done or {}):
+            self.file.write(f"{index} {done[index]:08x}\n")
+        self.file.flush()
+
+    def record(self, index, data):
+        crc = zlib.crc32(data)
+        self.file.write(f"{index} {crc:08x}\n")
+        self.file.flush()
+        return crc
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def remove(self):
+        self.close()
+        try:
+            os.remove(self.filename)
+        except FileNotFoundError:
+            pass
+
+
+def verified_blocks(done, data):
+    """Blocks from journal whose CRC still matches data (bytes-like), {index: crc}"""
+    view = memoryview(data)
+    try:
+        return {index: crc for index, crc in done.items()
+                if zlib.crc32(view[index * BLOCK_SIZE:(index + 1) * BLOCK_SIZE]) == crc}
+    finally:
+        view.release()
+
+
+def block_digest(data):
+    """Digest of one block content"""
+    return hashlib.sha256(data).hexdigest()
+
+
+ERASED_DIGEST = block_digest(b'\xFF' * BLOCK_SIZE)
+
+
+def coalesce(blocks):
+    """Turn block numbers into a list of (first, count) runs of consecutive blocks"""
+    ranges = []
+    for block in sorted(blocks):
+        if ranges and ranges[-1][0] + ranges[-1][1] == block:
+            ranges[-1] = (ranges[-1][0], ranges[-1][1] + 1)
+        else:
+            ranges.append((block, 1))
+    return ranges
@@ -6,8 +6,100 @@
 
 import serial
 import struct
-import time
 import argparse
+import mmap
+import os
+import sys
+from bulk_common import (BLOCK_SIZE, MAX_BLOCKS, open_port, erase_blocks, bump_erase_generation, device_id,
+                         erase_generation, coalesce)
+from bulk_list import load_cache, save_cache, scan_headers
+
+ERASED_BLOCK = b'\xFF' * BLOCK_SIZE
+
+
+def used_blocks_in_image(filename, first):
+    """Blocks of image dump (bulk_read.py) which are not entirely 0xFF, a partial last block included"""
+    if os.path.getsize(filename) == 0:
+        # mmap cannot map an empty file
+        return []
+    with open(filename, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        used = []
+        for index in range((len(data) + BLOCK_SIZE - 1) // BLOCK_SIZE):
+            block = data[index * BLOCK_SIZE:(index + 1) * BLOCK_SIZE]
+            if block != ERASED_BLOCK[:len(block)]:
+                used.append(first + index)
+        return used
+
+
+def used_blocks_on_device(ser, args):
+    """Blocks holding a file according to directory, cached or scanned from device headers"""
+    device = device_id(args.port)
+    generation = erase_generation(args.port)
+    entries = load_cache(device, generation, args.first, args.scan_blocks)
+    if entries is None:
+        entries = scan_headers(ser, args.first, args.scan_blocks, args.headers)
+        if entries is None:
+            return None
+        save_cache(device, generation, args.first, args.scan_blocks, entries)
+    else:
+        print(f"Cached directory of {device}, generation {generation}.")
+    return sorted({entry.block for entry in entries})
+
+
+def plan_erase(args):
+    """
+    Erase only used blocks, contiguous runs with one command each. Without
+    extended "e" command, "E" erases from block 0 up to the last used block.
+    """
+    ser = None
+    try:
+        if args.image:
+            used = used_blocks_in_image(args.image, args.first)
+        else:
+            ser = open_port(args.port, args.baudrate, args.timeout)
+            if ser is None:
+                return 1
+            used = used_blocks_on_device(ser, args)
+            if used is None:
+                return 1
+
+        ranges = coalesce(used)
+        print(f"Used blocks: {len(used)}, erase commands: {len(ranges)}")
+        for first, count in ranges:
+            print(f"  blocks {first}..{first + count - 1}")
+        if ranges and not args.extended and (len(ranges) > 1 or ranges[0][0]):
+            if args.first:
+                print(f"Error: Blocks before {args.first} are not known, erasing from block {ranges[0][0]} "
+                      "needs --extended with firmware supporting \"e\" (see README.md).")
+                return 1
+            last = ranges[-1][0] + ranges[-1][1]
+            print(f"Without --extended \"E\" erases from block 0, blocks 0..{last - 1} will be erased.")
+            ranges = [(0, last)]
+        if not ranges or args.dry_run:
+            return 0
+
+        print(f"WARNING! The data will be erased, type 'YES' in order to continue:")
+        if input() != "YES":
+            return 1
+
+        if ser is None:
+            ser = open_port(args.port, args.baudrate, args.timeout)
+            if ser is None:
+                return 1
+        bump_erase_generation(args.port)
+        for first, count in ranges:
+            if not erase_blocks(ser, first, count, args.extended):
+                return 1
+        print("ACK received. Used blocks erased.")
+        return 0
+    except OSError as e:
+        print(f"Error: {e}")
+        return 1
+    finally:
+        if ser is not None:
+            ser.close()
+            print(f"Serial port {args.port} closed.")
+
 
 def main():
     # Argument parser for serial port configuration
@@ -16,32 +108,21 @@ def main():
     parser.add_argument("--port", default="/dev/ttyUSB1", help="Serial port (default: /dev/ttyUSB1)")
     parser.add_argument("--baudrate", type=int, default=250000, help="Baud rate (default: 250000)")
     parser.add_argument("--timeout", type=float, default=600, help="Serial timeout in seconds (default: 600)")
+    parser.add_argument("--used", action="store_true", help="Erase only blocks holding files, directory is read from device headers (or cache)")
+    parser.add_argument("--image", help="Erase only blocks which are not empty in this image dump of the device")
+    parser.add_argument("--first", type=int, default=0, help="First block to scan, first block of the image (default: 0)")
+    parser.add_argument("--scan-blocks", type=int, default=MAX_BLOCKS, help=f"Number of blocks to scan with --used, 512 for W25Q128 (default: {MAX_BLOCKS})")
+    parser.add_argument("--headers", action="store_true", help="With --used, read headers only with extended 'h' command, needs firmware supporting it (see README.md)")
+    parser.add_argument("--extended", action="store_true", help="With --used or --image, erase runs not starting at block 0 with extended \"e\" command, needs firmware supporting it (see README.md)")
+    parser.add_argument("--dry-run", action="store_true", help="Only show which blocks would be erased")
     args = parser.parse_args()
 
-    # Open serial port
-    try:
-        ser = serial.Serial(
-            port=args.port,
-            baudrate=args.baudrate,
-            bytesize=serial.EIGHTBITS,
-            parity=serial.PARITY_NONE,
-            stopbits=serial.STOPBITS_ONE,
-            timeout=args.timeout
-        )
-    except serial.SerialException as e:
-        print(f"Error opening serial port: {e}")
-        return
-
-    print(f"Serial port {args.port} opened at {args.baudrate} baud.")
-    time.sleep(3)
+    if args.used or args.image:
+        return plan_erase(args)
 
-    print("Receiving initial output from the device...")
-    initial_data = ser.read_all()  # Read all available data
-    if initial_data:
-        print("Initial data received:")
-        print(initial_data.decode('utf-8', errors='replace'))  # Decode and print
-    else:
-        print("No initial data received.")
+    ser = open_port(args.port, args.baudrate, args.timeout)
+    if ser is None:
+        return
 
     # Send the "E" command
     try:
@@ -55,6 +136,7 @@ def main():
         blocks_pack = struct.pack("<H", args.blocks)  # Little-endian 2-byte size
         ser.write(b"E" + blocks_pack)
         print(f"Sent command 'E' {blocks_pack}.")
+        bump_erase_generation(args.port)
 
         # Wait for response
         print("Waiting for response...")
@@ -76,5 +158,5 @@ def main():
         print(f"Serial port {args.port} closed.")
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
 
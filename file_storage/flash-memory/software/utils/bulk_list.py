@@ -0,0 +1,122 @@
+#!/usr/bin/python3
+
+#########################################################
+# Bulk operations utility for Flash Disk storage device
+# Copyright (c) 2025 Arvid Juskaitis
+#
+# Directory listing from file entry headers: blocks are read with 'R' command,
+# with extended 'h' command only 32 bytes per block are transferred. Result is
+# cached, cache is valid until bulk tools modify the device (erase generation
+# changes).
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+from bulk_common import (BLOCK_SIZE, PAGES_PER_BLOCK, HEADER_SIZE, MAX_BLOCKS, CACHE_DIR, open_port,
+                         read_pages, read_headers, device_id, erase_generation)
+from simplefs import FileEntry, parse_entry, format_entry
+
+
+def cache_file(device):
+    return os.path.join(CACHE_DIR, f"dir-{hashlib.sha1(device.encode()).hexdigest()[:16]}.json")
+
+
+def load_cache(device, generation, first, blocks):
+    """Cached entries or None if there is no cache for this device, generation and range"""
+    try:
+        with open(cache_file(device)) as f:
+            cache = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+    if (cache.get("device"), cache.get("generation"), cache.get("first"), cache.get("blocks")) != \
+            (device, generation, first, blocks):
+        return None
+    return [FileEntry(*entry) for entry in cache["entries"]]
+
+
+def save_cache(device, generation, first, blocks, entries):
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    with open(cache_file(device), "w") as f:
+        json.dump({"device": device, "generation": generation, "first": first, "blocks": blocks,
+                   "entries": [list(entry) for entry in entries]}, f, indent=1)
+
+
+def scan_headers(ser, first, blocks, headers=False):
+    """
+    Read headers of blocks from device.
+
+    Args:
+        headers: read headers only with extended 'h' command instead of whole
+            blocks with 'R' command, needs firmware supporting it
+
+    Returns:
+        list of FileEntry of used blocks, or None if device did not send all data
+    """
+    if headers:
+        data = read_headers(ser, first, blocks)
+        stride = HEADER_SIZE
+    else:
+        data = read_pages(ser, first * PAGES_PER_BLOCK, blocks * PAGES_PER_BLOCK)
+        stride = BLOCK_SIZE
+    if len(data) != blocks * stride:
+        print(f"Error: Received {len(data)} of {blocks * stride} bytes.")
+        if headers and not data:
+            print("Device did not answer 'h' command, run without --headers for firmware without it.")
+        return None
+
+    # Block number is taken from position, header of a block holding
+    # something else than a file may carry any number
+    entries = []
+    for index in range(blocks):
+        entry = parse_entry(data, index * stride)
+        if entry is not None:
+            entries.append(entry._replace(block=first + index))
+    return entries
+
+
+def main():
+    parser = argparse.ArgumentParser(description="List files on Flash Disk from block headers.")
+    parser.add_argument("prefix", nargs="?", default="", help="List files starting with prefix (case-insensitive)")
+    parser.add_argument("--first", type=int, default=0, help="First block to scan (default: 0)")
+    parser.add_argument("--blocks", type=int, default=MAX_BLOCKS, help=f"Number of 32 kb blocks to scan, 512 for W25Q128 (default: {MAX_BLOCKS})")
+    parser.add_argument("--headers", action="store_true", help="Read headers only with extended 'h' command, needs firmware supporting it (see README.md)")
+    parser.add_argument("--refresh", action="store_true", help="Ignore cached directory, e.g. after files were saved with fdsh")
+    parser.add_argument("--port", default="/dev/ttyUSB1", help="Serial port (default: /dev/ttyUSB1)")
+    parser.add_argument("--baudrate", type=int, default=250000, help="Baud rate (default: 250000)")
+    parser.add_argument("--timeout", type=float, default=5, help="Serial timeout in seconds (default: 5)")
+    args = parser.parse_args()
+    if args.blocks < 1 or args.first < 0:
+        parser.error("first must not be negative, blocks must be positive")
+
+    device = device_id(args.port)
+    generation = erase_generation(args.port)
+
+    entries = None if args.refresh else load_cache(device, generation, args.first, args.blocks)
+    if entries is not None:
+        print(f"Cached directory of {device}, generation {generation}.")
+    else:
+        ser = open_port(args.port, args.baudrate, args.timeout)
+        if ser is None:
+            return 1
+        try:
+            entries = scan_headers(ser, args.first, args.blocks, args.headers)
+        finally:
+            ser.close()
+        # Nothing is cached unless the device sent every header
+        if entries is None:
+            return 1
+        save_cache(device, generation, args.first, args.blocks, entries)
+
+    prefix = args.prefix.lower()
+    print("Start    Stop  Size Blck Name\n-----------------------------")
+    for entry in entries:
+        if entry.name.lower().startswith(prefix):
+            print(format_entry(entry))
+    print(f"{args.blocks - len(entries)} of {args.blocks} blocks free")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
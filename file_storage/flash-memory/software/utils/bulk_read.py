@@ -4,80 +4,164 @@
 # Bulk operations utility for Flash Disk storage device
 # Copyright (c) 2025 Arvid Juskaitis
 
-import serial
 import argparse
-import struct
-import time
+import mmap
 import os
+import sys
+from bulk_common import (BLOCK_SIZE, PAGES_PER_BLOCK, open_port, send_read_command, read_into, skip_bytes,
+                         Progress, BlockJournal, verified_blocks, coalesce)
+
+# Seconds without data which end an unlimited read, unless --timeout is given
+UNLIMITED_TIMEOUT = 5
+
+def read_blocks(ser, data, missing, journal, done, args):
+    """
+    Read missing blocks into data. "R" reads from block 0 up to the last
+    missing block, blocks already done are skipped. With --extended,
+    contiguous runs are read with one "r" command each.
+
+    Returns:
+        number of bytes read
+    """
+    if not missing:
+        return 0
+
+    journal.open(done)
+    progress = Progress(len(missing) * BLOCK_SIZE, quiet=args.quiet)
+    total_bytes_read = 0
+    try:
+        runs = coalesce(missing) if args.extended else [(0, missing[-1] + 1)]
+        for first, count in runs:
+            send_read_command(ser, first * PAGES_PER_BLOCK, count * PAGES_PER_BLOCK, args.quiet, args.extended)
+            for block in range(first, first + count):
+                if block in done:
+                    if not skip_bytes(ser, BLOCK_SIZE):
+                        return total_bytes_read
+                    continue
+                view = memoryview(data)[block * BLOCK_SIZE:(block + 1) * BLOCK_SIZE]
+                try:
+                    count_read = read_into(ser, view, progress, total_bytes_read)
+                    total_bytes_read += count_read
+                    if count_read < BLOCK_SIZE:
+                        return total_bytes_read
+                    journal.record(block, view)
+                finally:
+                    view.release()
+        return total_bytes_read
+    finally:
+        progress.finish(total_bytes_read)
 
-def main():
-    # Argument parser for optional size and output file
-    parser = argparse.ArgumentParser(description="Read binary data from serial and write to a file.")
-    parser.add_argument("output_file", help="Path to the output file")
-    parser.add_argument("--blocks", type=int, default=0, help="Number of 32 kb blocks to read (default: 0 for unlimited)")
-    parser.add_argument("--port", default="/dev/ttyUSB1", help="Serial port (default: /dev/ttyUSB1)")
-    parser.add_argument("--baudrate", type=int, default=250000, help="Baud rate (default: 250000)")
-    parser.add_argument("--timeout", type=float, default=None, help="Serial timeout in seconds (default: None for blocking mode)")
-    args = parser.parse_args()
 
-    # Open serial port
+def read_unlimited(ser, f, args):
+    """
+    Read entire flash with "R 0", until device stops sending. Blocks are
+    appended to the file as they arrive.
+
+    Returns:
+        number of bytes read
+    """
+    send_read_command(ser, 0, 0, args.quiet)
+    progress = Progress(None, quiet=args.quiet)
+    buffer = bytearray(BLOCK_SIZE)
+    total_bytes_read = 0
     try:
-        ser = serial.Serial(port=args.port, baudrate=args.baudrate, bytesize=serial.EIGHTBITS, parity=serial.PARITY_NONE, stopbits=serial.STOPBITS_ONE, timeout=args.timeout)
-    except serial.SerialException as e:
-        print(f"Error opening serial port: {e}")
-        return
-
-    print(f"Serial port {args.port} opened at {args.baudrate} baud.")
-    time.sleep(3)
-
-    print("Receiving initial output from the device...")
-    initial_data = ser.read_all()  # Read all available data
-    if initial_data:
-        print("Initial data received:")
-        print(initial_data.decode('utf-8', errors='replace'))  # Decode and print
-    else:
-        print("No initial data received.")
-
-    # Open the output file
+        while True:
+            count_read = read_into(ser, buffer, progress, total_bytes_read)
+            f.write(memoryview(buffer)[:count_read])
+            total_bytes_read += count_read
+            if count_read < BLOCK_SIZE:
+                return total_bytes_read
+    finally:
+        progress.finish(total_bytes_read)
+
+
+def read_entire_flash(ser, args):
+    """Unlimited read, output file grows as data arrives"""
     try:
         with open(args.output_file, "wb") as f:
-            print(f"Output file {args.output_file} opened.")
+            if not args.quiet:
+                print(f"Output file {args.output_file} opened.")
+                print("Size in blocks: 0 (entire flash)")
+            total_bytes_read = read_unlimited(ser, f, args)
+    except IOError as e:
+        print(f"Error writing to file: {e}")
+        return 1
 
-            pages = args.blocks * 128
-            print(f"Size in blocks: {args.blocks}, pages: {pages}")
+    if total_bytes_read % BLOCK_SIZE:
+        print(f"Warning: Device stopped within block {total_bytes_read // BLOCK_SIZE}.")
+    if not args.quiet:
+        print(f"Finished reading. Total bytes written: {total_bytes_read}.")
+    return 0 if total_bytes_read else 1
 
-            # Prepare and send the "R" command with size
-            pages_pack = struct.pack("<H", pages)  # Little-endian 2-byte size
-            ser.write(b"R" + pages_pack)
-            print(f"Sent command 'R' {pages_pack}.")
 
-            time.sleep(3)
+def read_size(ser, args):
+    """Read of --blocks blocks, preallocated output file, resumable"""
+    blocks = args.blocks
+    size = blocks * BLOCK_SIZE
 
-            # Read and write data in 256-byte chunks
-            bytes_to_read = pages * 256 if pages > 0 else float("inf")  # Unlimited if size is 0
-            total_bytes_read = 0
+    journal = BlockJournal(args.output_file + ".journal", f"read 0 {blocks}")
+    resume = args.resume and os.path.exists(args.output_file) and os.path.getsize(args.output_file) == size
 
-            while total_bytes_read < bytes_to_read:
-                chunk_size = min(256, bytes_to_read - total_bytes_read)
-                data = ser.read(chunk_size)
+    # Preallocate the output file and receive straight into its mapping
+    try:
+        with open(args.output_file, "r+b" if resume else "w+b") as f:
+            f.truncate(size)
+            if not args.quiet:
+                print(f"Output file {args.output_file} opened.")
+                print(f"Size in blocks: {blocks}, pages: {blocks * PAGES_PER_BLOCK}")
+
+            with mmap.mmap(f.fileno(), size) as data:
+                done = verified_blocks(journal.load(), data) if resume else {}
+                missing = [block for block in range(blocks) if block not in done]
+                if done and not args.quiet:
+                    print(f"Resuming, {len(done)} blocks already read, {len(missing)} left.")
+                total_bytes_read = read_blocks(ser, data, missing, journal, done, args)
+                data.flush()
+
+    except (IOError, ValueError) as e:
+        print(f"Error writing to file: {e}")
+        return 1
+    finally:
+        journal.close()
 
-                if not data:  # No data received, exit loop
-                    print("No more data received.")
-                    break
+    if total_bytes_read < len(missing) * BLOCK_SIZE:
+        print(f"No more data received, {total_bytes_read} of {len(missing) * BLOCK_SIZE} bytes. Use --resume to continue.")
+        return 1
 
-                f.write(data)
-                total_bytes_read += len(data)
+    journal.remove()
+    if not args.quiet:
+        print(f"Finished reading. Total bytes written: {total_bytes_read}.")
+    return 0
 
-                print(f"Read {len(data)} bytes, total {total_bytes_read} bytes.")
+def main():
+    # Argument parser for optional size and output file
+    parser = argparse.ArgumentParser(description="Read binary data from serial and write to a file.")
+    parser.add_argument("output_file", help="Path to the output file")
+    parser.add_argument("--blocks", type=int, default=0, help="Number of 32 kb blocks to read (default: 0 for unlimited)")
+    parser.add_argument("--port", default="/dev/ttyUSB1", help="Serial port (default: /dev/ttyUSB1)")
+    parser.add_argument("--baudrate", type=int, default=250000, help="Baud rate (default: 250000)")
+    parser.add_argument("--timeout", type=float, default=None, help=f"Serial timeout in seconds (default: None for blocking mode, {UNLIMITED_TIMEOUT} with --blocks 0)")
+    parser.add_argument("--quiet", action="store_true", help="Print errors only, no progress")
+    parser.add_argument("--resume", action="store_true", help="Continue interrupted read, only blocks missing in the journal are read")
+    parser.add_argument("--extended", action="store_true", help="Resume with extended \"r\" command, needs firmware supporting it (see README.md)")
+    args = parser.parse_args()
 
-            print(f"Finished reading. Total bytes written: {total_bytes_read}.")
+    if args.blocks == 0 and args.resume:
+        print("Error: --resume needs --blocks, size of unlimited read is not known.")
+        return 1
 
-    except IOError as e:
-        print(f"Error writing to file: {e}")
+    timeout = args.timeout if args.timeout is not None or args.blocks else UNLIMITED_TIMEOUT
+    ser = open_port(args.port, args.baudrate, timeout, args.quiet)
+    if ser is None:
+        return 1
+    try:
+        if args.blocks == 0:
+            return read_entire_flash(ser, args)
+        return read_size(ser, args)
     finally:
         ser.close()
-        print(f"Serial port {args.port} closed.")
+        if not args.quiet:
+            print(f"Serial port {args.port} closed.")
 
 if __name__ == "__main__":
-    main()
-
+    sys.exit(main())
@@ -0,0 +1,213 @@
+#!/usr/bin/python3
+
+#########################################################
+# Bulk operations utility for Flash Disk storage device
+# Copyright (c) 2025 Arvid Juskaitis
+#
+# Differential write: only 32 kb blocks which differ from the image are
+# erased and written. Device content is read back with 'R' command, or taken
+# from the manifest saved by the previous sync. "E" erases from block 0, so
+# without extended commands blocks from 0 up to the last changed one are
+# erased and written.
+
+import argparse
+import json
+import mmap
+import os
+import sys
+import time
+from bulk_common import (BLOCK_SIZE, PAGES_PER_BLOCK, ERASED_DIGEST, open_port, read_pages,
+                         write_pages, erase_blocks, block_digest, coalesce, bump_erase_generation)
+
+
+def load_manifest(filename):
+    """Device block digests saved by previous sync, {block: digest}"""
+    try:
+        with open(filename) as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return {}
+    if manifest.get("block_size") != BLOCK_SIZE:
+        print(f"Manifest {filename} has different block size, ignored.")
+        return {}
+    return {int(block): digest for block, digest in manifest["blocks"].items()}
+
+
+def save_manifest(filename, digests):
+    with open(filename, "w") as f:
+        json.dump({"block_size": BLOCK_SIZE,
+                   "blocks": {str(block): digests[block] for block in sorted(digests)}}, f, indent=1)
+
+
+class ImageDigests(dict):
+    """Digests of image blocks keyed by device block, data - memoryview of the image"""
+
+    def __init__(self, data, offset):
+        super().__init__()
+        self.data = data
+        for index in range(len(data) // BLOCK_SIZE):
+            self[offset + index] = block_digest(data[index * BLOCK_SIZE:(index + 1) * BLOCK_SIZE])
+
+
+def read_device_digests(ser, blocks, extended=False):
+    """
+    Read blocks back from device and calculate their digests. "R" reads from
+    block 0, so blocks up to the last one are read with one command, with
+    extended every run is read with "r" command.
+
+    Returns:
+        {block: digest} or None if device did not send all data
+    """
+    digests = {}
+    runs = coalesce(blocks) if extended else [(min(blocks), max(blocks) - min(blocks) + 1)]
+    for first, count in runs:
+        print(f"Reading blocks {first}..{first + count - 1}...")
+        data = read_pages(ser, first * PAGES_PER_BLOCK, count * PAGES_PER_BLOCK, extended)
+        if len(data) != count * BLOCK_SIZE:
+            print(f"Error: Received {len(data)} of {count * BLOCK_SIZE} bytes.")
+            return None
+        for index in range(count):
+            digests[first + index] = block_digest(data[index * BLOCK_SIZE:(index + 1) * BLOCK_SIZE])
+    return digests
+
+
+def describe_ranges(ranges):
+    return ", ".join(f"{first}" if count == 1 else f"{first}..{first + count - 1}" for first, count in ranges)
+
+
+def sync_runs(changed, extended):
+    """Runs of blocks to erase and write, from block 0 up to the last changed one without extended"""
+    return coalesce(changed) if extended else [(0, max(changed) + 1)]
+
+
+def sync_blocks(ser, image, offset, changed, device, args):
+    """
+    Erase and write changed blocks, updates device digests as blocks are written.
+    Erase generation is bumped before the first command modifying the device.
+
+    Returns:
+        True if all blocks were written
+    """
+    modified = False
+    for first, count in sync_runs(changed, args.extended):
+        blocks = range(first, first + count)
+
+        # Skip erase if device blocks are known to be erased already
+        if any(device.get(block) != ERASED_DIGEST for block in blocks):
+            print(f"Erasing blocks {describe_ranges([(first, count)])}...")
+            if not modified:
+                bump_erase_generation(args.port)
+                modified = True
+            for block in blocks:
+                device.pop(block, None)
+            if not erase_blocks(ser, first, count, args.extended):
+                return False
+            for block in blocks:
+                device[block] = ERASED_DIGEST
+
+        # Blocks left empty in the image are done by erase
+        for wfirst, wcount in coalesce(block for block in blocks if image[block] != ERASED_DIGEST):
+            print(f"Writing blocks {describe_ranges([(wfirst, wcount)])}...")
+            if not modified:
+                bump_erase_generation(args.port)
+                modified = True
+            start = (wfirst - offset) * BLOCK_SIZE
+            for block in range(wfirst, wfirst + wcount):
+                device.pop(block, None)
+            data = image.data[start:start + wcount * BLOCK_SIZE]
+            ok = write_pages(ser, data, wfirst * PAGES_PER_BLOCK, args.window, args.retries)
+            data.release()
+            if not ok:
+                return False
+            for block in range(wfirst, wfirst + wcount):
+                device[block] = image[block]
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write only those 32 kb blocks of image which differ from device content.")
+    parser.add_argument("input_file", help="Path to the input binary file")
+    parser.add_argument("--offset", type=int, default=0, help="Offset in terms of 32 kb blocks to start writing from (default: 0). Note this number must match the first block in image file.")
+    parser.add_argument("--manifest", help="Device block digests from the previous sync, read and updated. Without it device is read back")
+    parser.add_argument("--readback", action="store_true", help="Read device back even if the manifest is present")
+    parser.add_argument("--dry-run", action="store_true", help="Only show which blocks differ")
+    parser.add_argument("--yes", action="store_true", help="Do not ask for confirmation")
+    parser.add_argument("--port", default="/dev/ttyUSB1", help="Serial port (default: /dev/ttyUSB1)")
+    parser.add_argument("--baudrate", type=int, default=250000, help="Baud rate (default: 250000)")
+    parser.add_argument("--timeout", type=float, default=5, help="Serial timeout in seconds (default: 5)")
+    parser.add_argument("--window", type=int, default=1, help="Number of pages sent ahead without waiting for ACK (default: 1)")
+    parser.add_argument("--retries", type=int, default=3, help="Retransmissions of a rejected page with --window 1 (default: 3)")
+    parser.add_argument("--extended", action="store_true", help="Read and erase changed runs with extended \"r\" and \"e\" commands, needs firmware supporting them (see README.md)")
+    args = parser.parse_args()
+    if args.window < 1:
+        parser.error("window must be at least 1")
+
+    try:
+        file_size = os.path.getsize(args.input_file)
+    except OSError as e:
+        print(f"Error reading the file: {e}")
+        return 1
+    if file_size == 0 or file_size % BLOCK_SIZE != 0:
+        print("Error: File size is not a multiple of 32 kb blocks.")
+        return 1
+
+    with open(args.input_file, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        view = memoryview(data)
+        image = ImageDigests(view, args.offset)
+        print(f"Input file {args.input_file}: blocks {args.offset}..{args.offset + len(image) - 1}.")
+
+        device = {}
+        if args.manifest and not args.readback:
+            device = load_manifest(args.manifest)
+        missing = [block for block in image if block not in device]
+
+        ser = None
+        try:
+            if missing or not args.dry_run:
+                ser = open_port(args.port, args.baudrate, args.timeout)
+                if ser is None:
+                    return 1
+
+            if missing:
+                read_back = read_device_digests(ser, missing, args.extended)
+                if read_back is None:
+                    return 1
+                device.update(read_back)
+
+            changed = [block for block in image if device[block] != image[block]]
+            print(f"{len(changed)} of {len(image)} blocks differ: {describe_ranges(coalesce(changed)) or 'none'}.")
+
+            if changed and not args.dry_run:
+                if not args.extended:
+                    if args.offset:
+                        print(f"Error: \"E\" erases from block 0, image starting at block {args.offset} "
+                              "needs --extended with firmware supporting \"e\" (see README.md).")
+                        return 1
+                    print(f"Blocks {describe_ranges(sync_runs(changed, False))} will be erased and written.")
+                if not args.yes:
+                    print(f"WARNING! The data will be erased, type 'YES' in order to continue:")
+                    if input() != "YES":
+                        return 1
+
+                start_time = time.monotonic()
+                ok = sync_blocks(ser, image, args.offset, changed, device, args)
+                elapsed = time.monotonic() - start_time
+                if not ok:
+                    print("Sync failed.")
+                else:
+                    print(f"{len(changed)} blocks synced in {elapsed:.1f} s.")
+            else:
+                ok = True
+        finally:
+            if args.manifest:
+                save_manifest(args.manifest, device)
+            view.release()
+            if ser is not None:
+                ser.close()
+                print(f"Serial port {args.port} closed.")
+
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
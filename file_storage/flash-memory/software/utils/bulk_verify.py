@@ -0,0 +1,222 @@
+#!/usr/bin/python3
+
+#########################################################
+# Bulk operations utility for Flash Disk storage device
+# Copyright (c) 2025 Arvid Juskaitis
+#
+# Read-back verification: device content is compared with the image block by
+# block using CRC-32, mismatching pages are reported, their blocks can be
+# erased and written again. Reading of block N runs in a separate thread
+# while block N-1 is checked, so verify takes about as long as the read.
+
+import argparse
+import mmap
+import os
+import queue
+import sys
+import threading
+import zlib
+from bulk_common import (BLOCK_SIZE, PAGE_SIZE, PAGES_PER_BLOCK, open_port, send_read_command, read_into, skip_bytes,
+                         read_pages, erase_blocks, write_pages, bump_erase_generation, coalesce, Progress)
+
+
+def block_range(data, index):
+    """Start and end of image block, the last block may be shorter"""
+    return index * BLOCK_SIZE, min(len(data), (index + 1) * BLOCK_SIZE)
+
+
+def reader(ser, data, offset, blocks, blocks_queue, quiet, extended):
+    """
+    Thread: read image blocks, put (index, buffer, bytes read) to the queue, None at the end.
+
+    "R" reads from device page 0 up to the last block, pages before the first
+    block and blocks in between which are not verified are skipped. With
+    extended, every run of blocks is read with one "r" command.
+    """
+    wanted = set(blocks)
+    runs = coalesce(wanted) if extended else [(min(wanted), max(wanted) - min(wanted) + 1)]
+    try:
+        for first, count in runs:
+            size = block_range(data, first + count - 1)[1] - first * BLOCK_SIZE
+            skip = send_read_command(ser, (first + offset) * PAGES_PER_BLOCK, size // PAGE_SIZE, quiet, extended)
+            if not skip_bytes(ser, skip):
+                start, end = block_range(data, first)
+                blocks_queue.put((first, bytearray(end - start), 0))
+                return
+            for index in range(first, first + count):
+                start, end = block_range(data, index)
+                buffer = bytearray(end - start)
+                count_read = read_into(ser, buffer)
+                if index in wanted or count_read < len(buffer):
+                    blocks_queue.put((index, buffer, count_read))
+                if count_read < len(buffer):
+                    return
+    finally:
+        blocks_queue.put(None)
+
+
+def verify_blocks(ser, data, offset, blocks=None, quiet=False, extended=False):
+    """
+    Read blocks back from device and compare them with the image.
+
+    Args:
+        ser: open serial port
+        data: image, bytes-like, size multiple of 256
+        offset: device block of the first image block
+        blocks: image block indexes to verify, all if None
+        quiet: print errors only
+        extended: read with "r" command, needs firmware supporting it
+
+    Returns:
+        ({image block index: [mismatching device pages]}, True if device sent everything)
+    """
+    if blocks is None:
+        blocks = range((len(data) + BLOCK_SIZE - 1) // BLOCK_SIZE)
+
+    # Double buffering: one block being read, one being checked
+    blocks_queue = queue.Queue(maxsize=2)
+    thread = threading.Thread(target=reader, args=(ser, data, offset, blocks, blocks_queue, quiet, extended),
+                              daemon=True)
+
+    total = sum(end - start for start, end in (block_range(data, index) for index in blocks))
+    progress = Progress(total, label="Verify", quiet=quiet)
+    done = 0
+    mismatches = {}
+    complete = True
+    view = memoryview(data)
+    try:
+        thread.start()
+        while True:
+            item = blocks_queue.get()
+            if item is None:
+                break
+            index, buffer, count_read = item
+            start, end = block_range(data, index)
+            expected = view[start:end]
+            if count_read < len(buffer):
+                print(f"\nError: Received {count_read} of {len(buffer)} bytes of block {index + offset}.")
+                complete = False
+            elif zlib.crc32(buffer) != zlib.crc32(expected):
+                mismatches[index] = [(index + offset) * PAGES_PER_BLOCK + page
+                                     for page in range(len(buffer) // PAGE_SIZE)
+                                     if buffer[page * PAGE_SIZE:(page + 1) * PAGE_SIZE] != expected[page * PAGE_SIZE:(page + 1) * PAGE_SIZE]]
+            expected.release()
+            done += count_read
+            progress.update(done)
+        thread.join()
+    finally:
+        view.release()
+    progress.finish(done)
+    return mismatches, complete and done == total
+
+
+def report(mismatches, offset):
+    for index in sorted(mismatches):
+        pages = mismatches[index]
+        print(f"Block {index + offset}: {len(pages)} pages differ: {', '.join(str(page) for page in pages)}")
+
+
+def rewrite_blocks(ser, data, offset, blocks, window=1, retries=3, extended=False):
+    """
+    Erase and write image blocks again. Device pages past the end of the image
+    in a partial last block are read before erase and written back.
+
+    Returns:
+        True if all blocks were erased and written
+    """
+    for first, count in coalesce(blocks):
+        print(f"Rewriting blocks {first + offset}..{first + offset + count - 1}...")
+        start = first * BLOCK_SIZE
+        end = block_range(data, first + count - 1)[1]
+        tail_page = (first + offset) * PAGES_PER_BLOCK + (end - start) // PAGE_SIZE
+        tail_pages = ((first + count) * BLOCK_SIZE - end) // PAGE_SIZE
+        tail = b""
+        if tail_pages:
+            tail = read_pages(ser, tail_page, tail_pages, extended)
+            if len(tail) != tail_pages * PAGE_SIZE:
+                print(f"Error: Received {len(tail)} of {tail_pages * PAGE_SIZE} bytes past the end of the image, "
+                      f"block {first + offset + count - 1} not rewritten.")
+                return False
+        if not erase_blocks(ser, first + offset, count, extended):
+            return False
+        view = memoryview(data)[start:end]
+        try:
+            if not write_pages(ser, view, (first + offset) * PAGES_PER_BLOCK, window, retries):
+                return False
+        finally:
+            view.release()
+        if tail and not write_pages(ser, tail, tail_page, window, retries):
+            return False
+    return True
+
+
+def verify(ser, data, offset, rewrite=False, window=1, retries=3, port=None, quiet=False, extended=False):
+    """
+    Verify image on device, optionally rewrite mismatching blocks and verify them again.
+    Without extended, only blocks in a run starting at device block 0 can be
+    rewritten, "E" erases from block 0.
+
+    Returns:
+        True if device content matches the image
+    """
+    mismatches, complete = verify_blocks(ser, data, offset, quiet=quiet, extended=extended)
+    if not complete:
+        return False
+    report(mismatches, offset)
+    if mismatches and rewrite:
+        # "E" erases from block 0 only
+        above = [first + offset for first, _ in coalesce(mismatches) if first + offset]
+        if above and not extended:
+            print(f"Error: Rewriting block {above[0]} needs extended \"e\" command, "
+                  "use --extended with firmware supporting it (see README.md).")
+            return False
+        if port is not None:
+            bump_erase_generation(port)
+        if not rewrite_blocks(ser, data, offset, sorted(mismatches), window, retries, extended):
+            return False
+        mismatches, complete = verify_blocks(ser, data, offset, sorted(mismatches), quiet, extended)
+        if not complete:
+            return False
+        report(mismatches, offset)
+    if not mismatches and not quiet:
+        print("Verified, device content matches the image.")
+    return not mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Read image back from device and compare it block by block.")
+    parser.add_argument("input_file", help="Path to the image file")
+    parser.add_argument("--offset", type=int, default=0, help="Offset in terms of 32 kb blocks (default: 0). Note this number must match the first block in image file.")
+    parser.add_argument("--rewrite", action="store_true", help="Erase and write blocks with mismatching pages again")
+    parser.add_argument("--port", default="/dev/ttyUSB1", help="Serial port (default: /dev/ttyUSB1)")
+    parser.add_argument("--baudrate", type=int, default=250000, help="Baud rate (default: 250000)")
+    parser.add_argument("--timeout", type=float, default=5, help="Serial timeout in seconds (default: 5)")
+    parser.add_argument("--window", type=int, default=1, help="Number of pages sent ahead without waiting for ACK when rewriting (default: 1)")
+    parser.add_argument("--retries", type=int, default=3, help="Retransmissions of a rejected page with --window 1 (default: 3)")
+    parser.add_argument("--quiet", action="store_true", help="Print errors and mismatches only")
+    parser.add_argument("--extended", action="store_true", help="Use extended \"r\" and \"e\" commands, needs firmware supporting them (see README.md)")
+    args = parser.parse_args()
+
+    try:
+        file_size = os.path.getsize(args.input_file)
+    except OSError as e:
+        print(f"Error reading the file: {e}")
+        return 1
+    if file_size == 0 or file_size % PAGE_SIZE != 0:
+        print("Error: File size is not a multiple of 256 bytes.")
+        return 1
+
+    ser = open_port(args.port, args.baudrate, args.timeout, args.quiet)
+    if ser is None:
+        return 1
+    try:
+        with open(args.input_file, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            ok = verify(ser, data, args.offset, args.rewrite, args.window, args.retries, args.port, args.quiet,
+                        args.extended)
+    finally:
+        ser.close()
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
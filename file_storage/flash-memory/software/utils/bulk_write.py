@@ -4,11 +4,40 @@
 # Bulk operations utility for Flash Disk storage device
 # Copyright (c) 2025 Arvid Juskaitis
 
-import serial
 import argparse
-import struct
 import time
 import os
+import mmap
+from bulk_common import (BLOCK_SIZE, PAGE_SIZE, PAGES_PER_BLOCK, open_port, write_pages, bump_erase_generation,
+                         BlockJournal, verified_blocks, coalesce)
+from bulk_verify import verify
+
+
+def write_blocks(ser, data, offs, missing, journal, args):
+    """
+    Write missing blocks, contiguous runs with one "W" command each.
+    Every block is recorded in journal once its last page is acknowledged.
+
+    Returns:
+        True if all pages were acknowledged
+    """
+    for first, count in coalesce(missing):
+        start = first * BLOCK_SIZE
+        end = min(len(data), (first + count) * BLOCK_SIZE)
+
+        def on_ack(page):
+            position = start + (page + 1) * PAGE_SIZE
+            if position % BLOCK_SIZE == 0 or position == end:
+                block = first + page // PAGES_PER_BLOCK
+                journal.record(block, data[block * BLOCK_SIZE:position])
+
+        view = memoryview(data)[start:end]
+        try:
+            if not write_pages(ser, view, offs + first * PAGES_PER_BLOCK, args.window, args.retries, on_ack):
+                return False
+        finally:
+            view.release()
+    return True
 
 def main():
     # Argument parser for file and serial port configuration
@@ -18,39 +47,29 @@ def main():
     parser.add_argument("--port", default="/dev/ttyUSB1", help="Serial port (default: /dev/ttyUSB1)")
     parser.add_argument("--baudrate", type=int, default=250000, help="Baud rate (default: 250000)")
     parser.add_argument("--timeout", type=float, default=5, help="Serial timeout in seconds (default: 5)")
+    parser.add_argument("--window", type=int, default=1, help="Number of pages sent ahead without waiting for ACK (default: 1)")
+    parser.add_argument("--retries", type=int, default=3, help="Retransmissions of a rejected page with --window 1 (default: 3)")
+    parser.add_argument("--resume", action="store_true", help="Continue interrupted write, only blocks missing in the journal are written")
+    parser.add_argument("--verify", action="store_true", help="Read written blocks back and compare them with the image")
+    parser.add_argument("--rewrite", action="store_true", help="Verify, erase and write blocks with mismatching pages again")
+    parser.add_argument("--extended", action="store_true", help="Verify and rewrite with extended \"r\" and \"e\" commands, needs firmware supporting them (see README.md)")
     args = parser.parse_args()
+    if args.window < 1:
+        parser.error("window must be at least 1")
 
-    # Open serial port
-    try:
-        ser = serial.Serial(
-            port=args.port,
-            baudrate=args.baudrate,
-            bytesize=serial.EIGHTBITS,
-            parity=serial.PARITY_NONE,
-            stopbits=serial.STOPBITS_ONE,
-            timeout=args.timeout
-        )
-    except serial.SerialException as e:
-        print(f"Error opening serial port: {e}")
+    ser = open_port(args.port, args.baudrate, args.timeout)
+    if ser is None:
         return
 
-    print(f"Serial port {args.port} opened at {args.baudrate} baud.")
-    time.sleep(3)
-
     offs = args.offset * 128
     print(f"Offset in blocks: {args.offset}, pages: {offs}")
 
-    print("Receiving initial output from the device...")
-    initial_data = ser.read_all()  # Read all available data
-    if initial_data:
-        print("Initial data received:")
-        print(initial_data.decode('utf-8', errors='replace'))  # Decode and print
-    else:
-        print("No initial data received.")
-
     # Open the input file
     try:
         file_size = os.path.getsize(args.input_file)
+        if file_size == 0:
+            print("Error: File is empty.")
+            return
         if file_size % 256 != 0:
             print("Error: File size is not a multiple of 256 bytes.")
             return
@@ -63,39 +82,33 @@ def main():
             pages = file_size // 256
             print(f"Number of blocks: {blocks}, pages to send: {pages}")
 
-            # Send the "W" command with the offs, size
-            offs_pack = struct.pack("<H", offs) # Little-endian 2-byte offs
-            pages_pack = struct.pack("<H", pages)  # Little-endian 2-byte size
-            ser.write(b"W" + offs_pack + pages_pack)
-            print(f"Sent command 'W' {offs_pack}, {pages_pack}.")
-
-            # Stream the content page by page
-            for page in range(pages):
-                page_data = f.read(256)  # Read a 256-byte page
-                if len(page_data) != 256:
-                    print(f"Error: Incomplete page read at page {page}.")
-                    return
-
-                # Send the page
-                ser.write(page_data)
-                print(f"Page {page + 1}/{pages} sent. Waiting for ACK...")
-
-                # Wait for ACK or NACK
-                ack = ser.read(1)  # Read 1 byte
-                if not ack:
-                    print("Error: No response received. Terminating transmission.")
-                    return
-
-                if ack == b'\xA0':  # ACK
-                    print(f"Page {page + 1}/{pages} acknowledged.")
-                elif ack == b'\xAF':  # NACK
-                    print(f"Page {page + 1}/{pages} rejected. Terminating transmission.")
-                    return
-                else:
-                    print(f"Unexpected response: {ack}. Terminating transmission.")
-                    return
-
-            print("Transmission completed successfully.")
+            journal = BlockJournal(args.input_file + ".journal", f"write {args.offset} {file_size}")
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                done = verified_blocks(journal.load(), data) if args.resume else {}
+                missing = [block for block in range((file_size + BLOCK_SIZE - 1) // BLOCK_SIZE) if block not in done]
+                if done:
+                    print(f"Resuming, {len(done)} blocks already written, {len(missing)} left.")
+
+                bump_erase_generation(args.port)
+                journal.open(done)
+                start_time = time.monotonic()
+                try:
+                    if not write_blocks(ser, data, offs, missing, journal, args):
+                        print("Use --resume to continue.")
+                        return
+                finally:
+                    journal.close()
+                elapsed = time.monotonic() - start_time
+                journal.remove()
+                written = sum(min(BLOCK_SIZE, file_size - block * BLOCK_SIZE) for block in missing)
+                print(f"{written} bytes written in {elapsed:.1f} s ({written / max(elapsed, 1e-3) / 1024:.1f} KB/s).")
+
+                print("Transmission completed successfully.")
+
+                if (args.verify or args.rewrite) and \
+                        not verify(ser, data, args.offset, args.rewrite, args.window, args.retries, args.port,
+                                   extended=args.extended):
+                    print("Verification failed.")
 
     except IOError as e:
         print(f"Error reading the file: {e}")
@@ -0,0 +1,405 @@
+#!/usr/bin/python3
+
+#########################################################
+# Bulk operations utility for Flash Disk storage device
+# Copyright (c) 2025 Arvid Juskaitis
+#
+# Nibble protocol codec. Data bytes travel over the bus as two nibbles with
+# DAT flag, MSN first, see RC6502-flash-protocol.md. Whole buffers are encoded
+# and decoded with translation tables and slice interleaving, no per-byte loop.
+# Transcripts of CMD_LIST/WRITE/READ/DELETE with BODT/EODT/ACK framing, as
+# fdsh (common.asm send_request, list.asm, read.asm, write.asm) exchanges
+# them, can be generated, checked against fdsh sequence and compared with
+# the emulator log (command 'l').
+#
+# Usage: nibble.py {list,write,read,delete} ... [--check emulator.log]
+
+import argparse
+import re
+import struct
+import sys
+
+# Command and marker values as in fdsh/defs.asm
+CMD_LIST = 0x01
+CMD_READ = 0x02
+CMD_WRITE = 0x03
+CMD_DELETE = 0x04
+ACK = 0xA0
+NACK = 0xAF
+BODT = 0x80
+EODT = 0x8F
+
+RDY_FLAG = 0x80
+BSY_FLAG = 0x40
+DAT_FLAG = 0x10
+
+# Nibbles sent by MCU are read with RDY flag set
+MCU_DAT_FLAG = RDY_FLAG | DAT_FLAG
+
+CPU = 0
+MCU = 1
+
+# FileEntry as in simplefs: block, start, size, name
+FILE_ENTRY = struct.Struct("<HHH26s")
+
+NAMES = {CMD_LIST: "CMD_LIST", CMD_READ: "CMD_READ", CMD_WRITE: "CMD_WRITE", CMD_DELETE: "CMD_DELETE",
+         ACK: "ACK", NACK: "NACK", BODT: "BODT", EODT: "EODT"}
+
+_HIGH = {}
+_LOW = {}
+_VALID = {}
+_DECODE_HIGH = bytes((value & 0x0F) << 4 for value in range(256))
+_DECODE_LOW = bytes(value & 0x0F for value in range(256))
+
+
+def _tables(flag):
+    """Translation tables for nibble flag, built on first use"""
+    if flag not in _HIGH:
+        _HIGH[flag] = bytes(flag | (value >> 4) for value in range(256))
+        _LOW[flag] = bytes(flag | (value & 0x0F) for value in range(256))
+        _VALID[flag] = bytes(flag | nibble for nibble in range(16))
+    return _HIGH[flag], _LOW[flag], _VALID[flag]
+
+
+def encode(data, flag=DAT_FLAG):
+    """
+    Encode bytes as nibble stream.
+
+    Args:
+        data: bytes-like
+        flag: flags of every nibble, DAT_FLAG as sent by CPU
+
+    Returns:
+        bytes, twice as long as data
+    """
+    high, low, _ = _tables(flag)
+    data = bytes(data)
+    stream = bytearray(2 * len(data))
+    stream[0::2] = data.translate(high)
+    stream[1::2] = data.translate(low)
+    return bytes(stream)
+
+
+def decode(stream, flag=DAT_FLAG):
+    """
+    Decode nibble stream to bytes.
+
+    Args:
+        stream: bytes-like of even length
+        flag: expected flags of every nibble, MCU_DAT_FLAG for nibbles read from MCU
+
+    Returns:
+        bytes, half as long as stream
+
+    Raises:
+        ValueError: odd length or byte other than a nibble with flag
+    """
+    stream = bytes(stream)
+    if len(stream) % 2:
+        raise ValueError(f"nibble stream of odd length {len(stream)}")
+    invalid = stream.translate(None, _tables(flag)[2])
+    if invalid:
+        raise ValueError(f"not a data nibble: 0x{invalid[0]:02X}")
+    # Both halves as big integers: high nibbles shifted into place, OR-ed at once
+    size = len(stream) // 2
+    high = int.from_bytes(stream[0::2].translate(_DECODE_HIGH), "big")
+    low = int.from_bytes(stream[1::2].translate(_DECODE_LOW), "big")
+    return (high | low).to_bytes(size, "big")
+
+
+class Transcript:
+    """Bus bytes of a protocol exchange with their senders, CPU or MCU"""
+
+    def __init__(self):
+        self.values = bytearray()
+        self.senders = bytearray()
+
+    def __len__(self):
+        return len(self.values)
+
+    def __eq__(self, other):
+        return self.values == other.values and self.senders == other.senders
+
+    def add(self, sender, *values):
+        self.values += bytes(values)
+        self.senders += bytes([sender]) * len(values)
+        return self
+
+    def add_acked(self, sender, values):
+        """Every byte of values is answered with ACK by the other side"""
+        stream = bytearray(2 * len(values))
+        stream[0::2] = values
+        stream[1::2] = bytes([ACK]) * len(values)
+        senders = bytearray(len(stream))
+        senders[0::2] = bytes([sender]) * len(values)
+        senders[1::2] = bytes([sender ^ 1]) * len(values)
+        self.values += stream
+        self.senders += senders
+        return self
+
+    def command(self, cmd, reply=ACK):
+        return self.add(CPU, cmd).add(MCU, reply)
+
+    def cpu_data(self, data, reply=ACK):
+        """
+        CPU sends data: MCU acknowledges BODT and EODT only.
+
+        Args:
+            reply: MCU reply to EODT, None if MCU answers with mcu_data()
+        """
+        self.add(CPU, BODT).add(MCU, ACK)
+        nibbles = encode(data)
+        self.values += nibbles
+        self.senders += bytes([CPU]) * len(nibbles)
+        self.add(CPU, EODT)
+        return self if reply is None else self.add(MCU, reply)
+
+    def mcu_data(self, data, eodt=True):
+        """
+        MCU sends data in one BODT..EODT block: CPU acknowledges every byte.
+
+        Args:
+            eodt: False if CPU stops reading after the last byte, EODT is left unread
+        """
+        self.add_acked(MCU, bytes([BODT]))
+        self.add_acked(MCU, encode(data, MCU_DAT_FLAG))
+        return self.add_acked(MCU, bytes([EODT])) if eodt else self
+
+    def log_lines(self):
+        """Lines as printed by the emulator (CPU side): TX for CPU, RX for MCU"""
+        return [f"{'RX' if sender else 'TX'}: {value:02X}, {value:08b}"
+                for value, sender in zip(self.values, self.senders)]
+
+    def lines(self):
+        """Lines with sender and marker names"""
+        return [f"{'MCU' if sender else 'CPU'} {NAMES.get(value, f'0x{value:02X}')}"
+                for value, sender in zip(self.values, self.senders)]
+
+
+LOG_LINE = re.compile(r"^(TX|RX): ([0-9A-Fa-f]{2})")
+
+
+def parse_log(text):
+    """Transcript from emulator log output"""
+    transcript = Transcript()
+    for line in text.splitlines():
+        match = LOG_LINE.match(line.strip())
+        if match:
+            transcript.add(MCU if match.group(1) == "RX" else CPU, int(match.group(2), 16))
+    return transcript
+
+
+def first_difference(expected, actual):
+    """Index of the first differing byte, None if transcripts are equal"""
+    for index, (a, b) in enumerate(zip(zip(expected.values, expected.senders), zip(actual.values, actual.senders))):
+        if a != b:
+            return index
+    return None if len(expected) == len(actual) else min(len(expected), len(actual))
+
+
+class _Reader:
+    """Reads transcript byte by byte, raises ValueError at a byte fdsh would not take"""
+
+    MCU_VALUES = frozenset(_tables(MCU_DAT_FLAG)[2] + bytes([ACK, NACK, BODT, EODT]))
+
+    def __init__(self, transcript):
+        self.items = list(zip(transcript.senders, transcript.values))
+        self.index = 0
+
+    def take(self, sender, *expected):
+        if self.index >= len(self.items):
+            raise ValueError(f"transcript ends, {'MCU' if sender else 'CPU'} byte expected")
+        actual_sender, value = self.items[self.index]
+        allowed = expected or (self.MCU_VALUES if sender == MCU else _tables(DAT_FLAG)[2])
+        if actual_sender != sender or value not in allowed:
+            names = " or ".join(NAMES.get(value, f"0x{value:02X}") for value in expected) or "data"
+            raise ValueError(f"{'MCU' if sender else 'CPU'} {names} expected, "
+                             f"got {'MCU' if actual_sender else 'CPU'} {NAMES.get(value, f'0x{value:02X}')}")
+        self.index += 1
+        return value
+
+    def cpu_data(self):
+        """CPU data after BODT up to EODT, as send_data_byte sends it"""
+        while self.index < len(self.items) and self.items[self.index] != (CPU, EODT):
+            self.take(CPU)
+            self.take(CPU)
+        self.take(CPU, EODT)
+
+    def receive_data_byte(self):
+        """Byte as receive_data_byte returns it, None for ST_DONE"""
+        value = self.take(MCU)
+        if value == NACK:
+            return None
+        self.take(CPU, ACK)
+        if value == EODT or not value & DAT_FLAG:
+            return None
+        low = self.take(MCU)
+        if low == NACK:
+            return None
+        self.take(CPU, ACK)
+        if not low & DAT_FLAG:
+            raise ValueError(f"MCU data nibble expected, got {NAMES.get(low, f'0x{low:02X}')}")
+        return (value & 0x0F) << 4 | low & 0x0F
+
+    def done(self):
+        if self.index < len(self.items):
+            raise ValueError("fdsh stops reading here")
+
+
+def fdsh_check(transcript):
+    """
+    Follow transcript the way fdsh does (REAL_HW build).
+
+    Returns:
+        None if fdsh takes the whole transcript, otherwise (index of the first
+        byte it does not take, reason)
+    """
+    reader = _Reader(transcript)
+    try:
+        cmd = reader.take(CPU, CMD_LIST, CMD_READ, CMD_WRITE, CMD_DELETE)
+        if reader.take(MCU, ACK, NACK) == NACK:
+            return reader.done()
+        reader.take(CPU, BODT)
+        if reader.take(MCU, ACK, NACK) == NACK:
+            return reader.done()
+        reader.cpu_data()
+
+        if cmd == CMD_WRITE:
+            if reader.take(MCU, ACK, NACK) == NACK:
+                return reader.done()
+            reader.take(CPU, BODT)
+            if reader.take(MCU, ACK, NACK) == ACK:
+                reader.cpu_data()
+                reader.take(MCU, ACK, NACK)
+            return reader.done()
+        if cmd == CMD_DELETE:
+            reader.take(MCU, ACK, NACK, EODT)
+            return reader.done()
+
+        # LIST and READ: data block follows the name without ACK in between
+        if reader.take(MCU, BODT, NACK, EODT) != BODT:
+            return reader.done()
+        reader.take(CPU, ACK)
+        entry = bytearray()
+        while len(entry) < FILE_ENTRY.size:
+            value = reader.receive_data_byte()
+            if value is None:
+                if entry:
+                    raise ValueError(f"incomplete file entry, {len(entry)} bytes")
+                return reader.done()
+            entry.append(value)
+            if cmd == CMD_LIST and len(entry) == FILE_ENTRY.size:
+                # Entries follow back to back in the same block
+                entry.clear()
+        # READ: content of FileEntry size, EODT is not read once it is complete
+        size = FILE_ENTRY.unpack(entry)[2]
+        received = 0
+        while reader.receive_data_byte() is not None:
+            received += 1
+            if received >= size:
+                break
+        return reader.done()
+    except ValueError as e:
+        return reader.index, str(e)
+
+
+def list_transcript(pattern, entries):
+    """CMD_LIST: CPU sends name pattern, MCU sends matching file entries in one block"""
+    return Transcript().command(CMD_LIST).cpu_data(pattern, None).mcu_data(b"".join(entries))
+
+
+def write_transcript(name, data, accepted=True):
+    """CMD_WRITE: CPU sends file name and content, MCU declines name if invalid or no room left"""
+    transcript = Transcript().command(CMD_WRITE).cpu_data(name, ACK if accepted else NACK)
+    return transcript.cpu_data(data) if accepted else transcript
+
+
+def read_transcript(name, entry=None, data=b""):
+    """
+    CMD_READ: CPU sends file name, MCU sends FileEntry and content in one block.
+
+    Args:
+        entry: 32 bytes FileEntry, None if file is not found
+        data: content, FileEntry size bytes
+    """
+    if entry is None:
+        return Transcript().command(CMD_READ).cpu_data(name, NACK)
+    if len(entry) != FILE_ENTRY.size:
+        raise ValueError(f"file entry of {len(entry)} bytes, {FILE_ENTRY.size} expected")
+    # fdsh stops reading once content is complete, EODT is read only after empty content
+    return Transcript().command(CMD_READ).cpu_data(name, None).mcu_data(bytes(entry) + bytes(data), eodt=not data)
+
+
+def delete_transcript(name, found=True):
+    """CMD_DELETE: CPU sends file name, MCU declines if not found"""
+    return Transcript().command(CMD_DELETE).cpu_data(name, ACK if found else NACK)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate nibble protocol transcripts, compare them with emulator log.")
+    parser.add_argument("command", choices=["list", "write", "read", "delete"])
+    parser.add_argument("name", help="File name or search pattern, '#123' for block id")
+    parser.add_argument("file", nargs="?", help="Content for write/read, file entries (32 bytes each) for list")
+    parser.add_argument("--start", default="0280", help="Start address (hex) in FileEntry for read (default: 0280)")
+    parser.add_argument("--block", type=int, default=0, help="Block number in FileEntry for read (default: 0)")
+    parser.add_argument("--not-found", action="store_true", help="MCU declines the name")
+    parser.add_argument("--check", metavar="LOG", help="Compare with emulator log instead of printing")
+    parser.add_argument("--names", action="store_true", help="Print markers by name instead of emulator log format")
+    args = parser.parse_args()
+
+    name = args.name.encode("ascii")
+    data = b""
+    if args.file:
+        try:
+            with open(args.file, "rb") as f:
+                data = f.read()
+        except OSError as e:
+            print(f"Error reading the file: {e}")
+            return 1
+
+    if args.command == "list":
+        transcript = list_transcript(name, [data[i:i + 32] for i in range(0, len(data), 32)])
+    elif args.command == "write":
+        transcript = write_transcript(name, data, not args.not_found)
+    elif args.command == "read":
+        entry = None
+        if not args.not_found:
+            try:
+                entry = FILE_ENTRY.pack(args.block, int(args.start, 16), len(data), b"" if name.startswith(b"#") else name)
+            except (ValueError, struct.error) as e:
+                print(f"Error: {e}")
+                return 1
+        transcript = read_transcript(name, entry, data)
+    else:
+        transcript = delete_transcript(name, not args.not_found)
+
+    deviation = fdsh_check(transcript)
+    if deviation:
+        print(f"Error: fdsh would stop at byte {deviation[0]}: {deviation[1]}")
+        return 1
+
+    if args.check:
+        try:
+            with open(args.check) as f:
+                actual = parse_log(f.read())
+        except OSError as e:
+            print(f"Error reading the log: {e}")
+            return 1
+        index = first_difference(transcript, actual)
+        if index is None:
+            print(f"Log matches, {len(transcript)} bytes.")
+            return 0
+        expected_lines, actual_lines = transcript.log_lines(), actual.log_lines()
+        print(f"Log differs at byte {index}: expected {expected_lines[index] if index < len(expected_lines) else 'end'}, "
+              f"got {actual_lines[index] if index < len(actual_lines) else 'end'}")
+        deviation = fdsh_check(actual)
+        if deviation:
+            print(f"fdsh would stop at byte {deviation[0]}: {deviation[1]}")
+        return 1
+
+    print("\n".join(transcript.lines() if args.names else transcript.log_lines()))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
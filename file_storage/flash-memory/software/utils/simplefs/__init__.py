@@ -0,0 +1,8 @@
+#########################################################
+# SimpleFS image access for Flash Disk storage device
+# Copyright (c) 2025 Arvid Juskaitis
+#
+# Host side counterpart of fdutil/simplefs.c, see simple-file-system.txt
+
+from .image import (PAGE_SIZE, BLOCK_SIZE, MAX_BLOCKS, MAX_NAME_SIZE, MAX_FILE_SIZE, FILE_ENTRY,
+                    FileEntry, SimpleFS, SimpleFSError, parse_entry, format_entry)
@@ -0,0 +1,81 @@
+#########################################################
+# SimpleFS image access for Flash Disk storage device
+# Copyright (c) 2025 Arvid Juskaitis
+#
+# Command line syntax is the same as in fdutil:
+#   python3 -m simplefs <image_file> l[prefix]
+#   python3 -m simplefs <image_file> w<name>#<start>#<stop> <file>
+#   python3 -m simplefs <image_file> r<name|#block> <file>
+#   python3 -m simplefs <image_file> d<name|#block>
+
+import argparse
+import sys
+from .image import SimpleFS, SimpleFSError, format_entry
+
+
+def handle_list(fs, prefix):
+    print("Start    Stop  Size Blck Name\n-----------------------------")
+    for entry in fs.list(prefix):
+        print(format_entry(entry))
+    print(f"{fs.free_blocks()} of {fs.blocks} blocks free")
+
+
+def handle_write(fs, spec, filename):
+    try:
+        name, start, _ = spec.split("#")
+        start = int(start, 16)
+    except ValueError:
+        raise SimpleFSError("Invalid syntax for write")
+    with open(filename, "rb") as f:
+        data = f.read()
+    # Size is the file length, fdutil uses start + actual_size as stop too
+    if start < 0 or start + len(data) > 0x10000:
+        raise SimpleFSError(f"File {filename} with {len(data)} bytes does not fit at ${start:04X}")
+    print(f"Number of bytes to write: {len(data)}")
+    block = fs.write(name, start, data)
+    print(f"File {name} written to block {block}.")
+
+
+def handle_read(fs, name, filename):
+    data = fs.read(name)
+    with open(filename, "wb") as f:
+        f.write(data)
+    print(f"File {name} read successfully to {filename}.")
+
+
+def handle_delete(fs, name):
+    block = fs.delete(name)
+    print(f"File {name} (block {block}) deleted successfully.")
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="simplefs", description="Manage SimpleFS image offline, commands as in fdutil.")
+    parser.add_argument("image_file", help="Image file, e.g. made by bulk_read.py")
+    parser.add_argument("command", help="l[prefix], w<name>#<start>#<stop>, r<name|#block>, d<name|#block>")
+    parser.add_argument("file", nargs="?", help="Input file for w, output file for r")
+    parser.add_argument("--first-block", type=int, default=0, help="Device block of the first image block (default: 0)")
+    args = parser.parse_args()
+
+    command, operand = args.command[0], args.command[1:]
+    if command not in "lwrd" or (command in "wr") != (args.file is not None):
+        parser.print_usage()
+        return 1
+
+    try:
+        with SimpleFS(args.image_file, args.first_block, readonly=command in "lr") as fs:
+            if command == "l":
+                handle_list(fs, operand)
+            elif command == "w":
+                handle_write(fs, operand, args.file)
+            elif command == "r":
+                handle_read(fs, operand, args.file)
+            else:
+                handle_delete(fs, operand)
+    except (OSError, SimpleFSError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,230 @@
+#########################################################
+# SimpleFS image access for Flash Disk storage device
+# Copyright (c) 2025 Arvid Juskaitis
+
+import bisect
+import mmap
+import struct
+from collections import namedtuple
+
+PAGE_SIZE = 256
+BLOCK_SIZE = 32768
+MAX_BLOCKS = 8192 // 32
+MAX_NAME_SIZE = 26
+FREE_BLOCK = 0xFFFF
+
+# FileEntry_t from simplefs.h: block, start, size, name
+FILE_ENTRY = struct.Struct("<HHH26s")
+MAX_FILE_SIZE = BLOCK_SIZE - FILE_ENTRY.size
+
+FileEntry = namedtuple("FileEntry", ["block", "start", "size", "name"])
+
+
+class SimpleFSError(Exception):
+    """File not found, no room left, invalid name or data"""
+
+
+def parse_entry(buffer, offset=0):
+    """
+    Decode FileEntry_t header.
+
+    Args:
+        buffer: bytes-like, at least 32 bytes from offset
+        offset: position of the header in buffer
+
+    Returns:
+        FileEntry or None if block is free
+    """
+    block, start, size, name = FILE_ENTRY.unpack_from(buffer, offset)
+    if block == FREE_BLOCK:
+        return None
+    name = name.split(b"\0", 1)[0].decode("ascii", errors="replace")
+    return FileEntry(block, start, size, name)
+
+
+def format_entry(entry):
+    """One line as printed by fdutil l"""
+    return f"${entry.start:04X} - ${(entry.start + entry.size) & 0xFFFF:04X} {entry.size:5d} {entry.block:4d} {entry.name}"
+
+
+class SimpleFS:
+    """
+    SimpleFS image (dump made by bulk_read.py or fdutil) mapped into memory.
+
+    Directory is built in a single pass over block headers: name index
+    (case-insensitive, names are not unique, lowest block wins as in
+    find_entry()) and free block map. Lookups do not touch the image after that.
+
+    Usage:
+        with SimpleFS("disk.img") as fs:
+            for entry in fs.list("games/"):
+                print(format_entry(entry))
+            data = fs.read("life")
+    """
+
+    def __init__(self, filename, first_block=0, readonly=False):
+        """
+        Args:
+            filename: image file, size multiple of 32 kb
+            first_block: device block of the first image block, see fdutil m
+            readonly: map read only, write and delete are not allowed
+        """
+        self.filename = filename
+        self.first_block = first_block
+        self.readonly = readonly
+        self.file = open(filename, "rb" if readonly else "r+b")
+        try:
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ if readonly else mmap.ACCESS_WRITE)
+        except ValueError:
+            self.file.close()
+            raise SimpleFSError(f"'{filename}' is empty")
+        if len(self.map) % BLOCK_SIZE != 0:
+            self.close()
+            raise SimpleFSError(f"'{filename}' size is not a multiple of 32 kb blocks")
+
+        self.blocks = len(self.map) // BLOCK_SIZE
+        self.entries = {}
+        self.names = {}
+        self.free = bytearray(self.blocks)
+        for index in range(self.blocks):
+            entry = parse_entry(self.map, index * BLOCK_SIZE)
+            if entry is None:
+                self.free[index] = 1
+            else:
+                self._add(first_block + index, entry)
+
+    def _add(self, block, entry):
+        self.entries[block] = entry
+        bisect.insort(self.names.setdefault(entry.name.lower(), []), block)
+
+    def _remove(self, block):
+        entry = self.entries.pop(block)
+        blocks = self.names[entry.name.lower()]
+        blocks.remove(block)
+        if not blocks:
+            del self.names[entry.name.lower()]
+        self.free[block - self.first_block] = 1
+
+    def _offset(self, block):
+        index = block - self.first_block
+        if not 0 <= index < self.blocks:
+            raise SimpleFSError(f"Block {block} is not in the image")
+        return index * BLOCK_SIZE
+
+    def list(self, prefix=""):
+        """Entries with name beginning with prefix (case-insensitive), in block order"""
+        prefix = prefix.lower()
+        return [self.entries[block] for block in sorted(self.entries)
+                if self.entries[block].name.lower().startswith(prefix)]
+
+    def find(self, name):
+        """
+        Block of the file or None. Names are compared as nameExactMatch() does:
+        case-insensitive over the length of the stored name, so stored "life"
+        matches "LIFE" and "life.bas" too. Lowest block wins.
+        """
+        name = name.lower()
+        blocks = [self.names[name[:length]][0] for length in range(len(name) + 1) if name[:length] in self.names]
+        return min(blocks) if blocks else None
+
+    def resolve(self, name):
+        """
+        Block by file name or by block id as in fdsh, e.g. "#123".
+
+        Raises:
+            SimpleFSError if there is no such file
+        """
+        if name.startswith("#"):
+            try:
+                block = int(name[1:])
+            except ValueError:
+                raise SimpleFSError(f"Invalid block id '{name}'")
+            if block not in self.entries:
+                raise SimpleFSError(f"Block {block} is not valid")
+            return block
+        block = self.find(name)
+        if block is None:
+            raise SimpleFSError(f"File '{name}' not found")
+        return block
+
+    def entry(self, name):
+        """FileEntry by name or "#block" """
+        return self.entries[self.resolve(name)]
+
+    def read(self, name):
+        """File content by name or "#block" """
+        block = self.resolve(name)
+        offset = self._offset(block) + FILE_ENTRY.size
+        return bytes(self.map[offset:offset + self.entries[block].size])
+
+    def free_blocks(self):
+        """Number of free blocks"""
+        return self.free.count(1)
+
+    def write(self, name, start, data):
+        """
+        Store a file in the lowest free block, the same way as fdutil w.
+
+        Args:
+            name: file name, truncated to 25 chars
+            start: load address
+            data: file content, up to 32736 bytes
+
+        Returns:
+            block number
+        """
+        if self.readonly:
+            raise SimpleFSError("Image is opened read only")
+        if not name or "#" in name:
+            raise SimpleFSError(f"Invalid file name '{name}'")
+        if len(data) > MAX_FILE_SIZE:
+            raise SimpleFSError(f"File is too large, {len(data)} bytes, max {MAX_FILE_SIZE}")
+        index = self.free.find(1)
+        if index < 0:
+            raise SimpleFSError("No room left")
+
+        block = self.first_block + index
+        encoded = name.encode("ascii")[:MAX_NAME_SIZE - 1]
+        content = bytearray(b"\xFF" * BLOCK_SIZE)
+        # First page is zero padded, the rest stays erased
+        content[:PAGE_SIZE] = bytes(PAGE_SIZE)
+        FILE_ENTRY.pack_into(content, 0, block, start, len(data), encoded)
+        content[FILE_ENTRY.size:FILE_ENTRY.size + len(data)] = data
+
+        offset = index * BLOCK_SIZE
+        self.map[offset:offset + BLOCK_SIZE] = content
+        self.free[index] = 0
+        self._add(block, parse_entry(content))
+        return block
+
+    def delete(self, name):
+        """
+        Delete file by name or "#block", block is filled with 0xFF.
+
+        Returns:
+            block number
+        """
+        if self.readonly:
+            raise SimpleFSError("Image is opened read only")
+        block = self.resolve(name)
+        offset = self._offset(block)
+        self.map[offset:offset + BLOCK_SIZE] = b"\xFF" * BLOCK_SIZE
+        self._remove(block)
+        return block
+
+    def flush(self):
+        if not self.readonly:
+            self.map.flush()
+
+    def close(self):
+        if self.map is not None:
+            self.flush()
+            self.map.close()
+            self.map = None
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -1,15 +1,12 @@
 #!/usr/bin/python3
 
 import sys
+from nibble import encode
 
 def print_nibbles(input_string):
-    for c in input_string:
-        val = ord(c)
-        ms = (val >> 4) & 0x0F
-        ms += 0x10
-        ls = val & 0x0F
-        ls += 0x10
-        
+    # Code points are masked to a byte as the bus carries 8 bits
+    nibbles = encode(bytes(ord(c) & 0xFF for c in input_string))
+    for ms, ls in zip(nibbles[0::2], nibbles[1::2]):
         # Print the hex values
         # Format as hex, ensuring two-digit hex with uppercase letters:
         #print(f"MCU, CPU - 0x{ms:02X}, ACK, 0x{ls:02X}, ACK")
@@ -22,4 +19,3 @@ if __name__ == "__main__":
         print_nibbles(input_str)
     else:
         print("Usage: python script.py <string>")
-
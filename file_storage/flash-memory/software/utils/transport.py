@@ -0,0 +1 @@
+../../../../software/scripts/transport.py
\ No newline at end of file
@@ -0,0 +1 @@
+../scripts/acia.py
\ No newline at end of file
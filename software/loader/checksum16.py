@@ -0,0 +1 @@
+../scripts/checksum16.py
\ No newline at end of file
@@ -2,30 +2,35 @@
 
 import sys
 import time
+import argparse
 import serial
+from checksum16 import checksum16
+from transport import connect
+from acia import download, verified_download, describe, effective_baud, SETTLE
 
 def main():
-    if len(sys.argv) < 4:
-        print("Usage: downloader_acia.py <binary_file> <start_addr_hex> <stop_addr_hex> [port] [baud]")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(description="Download memory range to binary file via ACIA loader.")
+    parser.add_argument("binary_file", help="File to save")
+    parser.add_argument("start_addr", help="Start address in hex, e.g. 300")
+    parser.add_argument("stop_addr", help="Stop address in hex, exclusive")
+    parser.add_argument("port", nargs="?", default="/dev/ttyS0", help="Serial port (default: /dev/ttyS0)")
+    parser.add_argument("baud", nargs="?", type=int, default=28800, help="Baud rate (default: 28800)")
+    parser.add_argument("--verify", action="store_true", help="Read range again, read again ranges whose checksums differ")
+    parser.add_argument("--retries", type=int, default=3, help="With --verify, rounds of reading differing ranges again (default: 3)")
+    parser.add_argument("--settle", type=float, default=SETTLE, help=f"Seconds between loader commands (default: {SETTLE})")
+    args = parser.parse_args()
 
-    filename = sys.argv[1]
-    start_addr_str = sys.argv[2]
-    stop_addr_str = sys.argv[3]
-    serial_port = "/dev/ttyS0" if len(sys.argv) < 5 else sys.argv[4]
-    baud_rate = 28800 if len(sys.argv) < 6 else int(sys.argv[5])
-    
     # Convert hex addresses to integers
     try:
-        start_addr = int(start_addr_str, 16)
+        start_addr = int(args.start_addr, 16)
     except ValueError:
-        print(f"Error: invalid start address '{start_addr_str}' (must be hex, e.g. 300).")
+        print(f"Error: invalid start address '{args.start_addr}' (must be hex, e.g. 300).")
         sys.exit(1)
 
     try:
-        stop_addr = int(stop_addr_str, 16)
+        stop_addr = int(args.stop_addr, 16)
     except ValueError:
-        print(f"Error: invalid stop address '{stop_addr_str}' (must be hex, e.g. 300).")
+        print(f"Error: invalid stop address '{args.stop_addr}' (must be hex, e.g. 300).")
         sys.exit(1)
 
     # Calculate how many bytes we expect to receive (stop address is exclusive)
@@ -36,50 +41,36 @@ def main():
 
     # Let the user know what's happening
     print(f"Reading {length} bytes from address range {start_addr:04X}-{stop_addr:04X}")
-    print(f"Using port {serial_port} at {baud_rate} baud")
+    print(f"Using port {args.port} at {args.baud} baud")
 
     try:
-        with serial.Serial(serial_port, baud_rate, timeout=15) as ser:
-            # Send command to initiate data read from the device
-            ser.write('t'.encode('ascii'))
-            time.sleep(0.01)
-
-            # Prepare bytes for start and stop addresses
-            # The device must interpret 'stop_addr' as exclusive on its side.
-            addresses = [
-                start_addr & 0xFF,
-                (start_addr >> 8) & 0xFF,
-                stop_addr & 0xFF,
-                (stop_addr >> 8) & 0xFF,
-            ]
-
-            # Send address bytes
-            for b in addresses:
-                ser.write(bytes([b]))
-                time.sleep(0.005)  # slight delay
-
-            # Now read the data
+        with connect(args.port, args.baud, timeout=15) as ser:
             start = time.time()
-            received_data = ser.read(length)
+            received_data = download(ser, start_addr, stop_addr, args.baud, timeout=15)
             end = time.time()
             if len(received_data) != length:
                 print(f"Error: expected {length} bytes, got {len(received_data)} bytes.")
                 sys.exit(1)
+            print(f"Received {length} bytes in {end - start:.2f}s " f"≈ {effective_baud(length, end - start):.0f} baud")
 
-            bps = length * 10 / (end - start)   # approximate bit rate (8N1)
-            print(f"Received {length} bytes in {end - start:.2f}s " f"≈ {bps:.0f} baud")
+            if args.verify:
+                time.sleep(args.settle)
+                received_data, differing = verified_download(ser, start_addr, stop_addr, args.baud,
+                                                             args.retries, args.settle, received_data)
+                if differing:
+                    print(f"Error: reads still differ in {describe(differing, start_addr)}.")
+                    sys.exit(1)
+                print("Verified.")
 
             # Calculate a checksum
-            checksum = 0
-            for b in received_data:
-                checksum = (checksum + b) & 0xFFFF
+            checksum = checksum16(received_data)
 
             # Write the received bytes to file
-            with open(filename, "wb") as f:
+            with open(args.binary_file, "wb") as f:
                 f.write(received_data)
 
             print(f"Data read complete. Checksum: {checksum:04X}")
-            print(f"Saved to file: {filename}")
+            print(f"Saved to file: {args.binary_file}")
 
     except serial.SerialException as e:
         print(f"Error opening/using serial port: {e}")
@@ -0,0 +1 @@
+../scripts/transport.py
\ No newline at end of file
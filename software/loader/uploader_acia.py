@@ -2,73 +2,74 @@
 
 import sys
 import os
-import time
+import argparse
 import serial
+from checksum16 import checksum16
+from transport import connect
+from acia import upload, verified_upload, calibrate, describe, effective_baud, BYTE_DELAY, SETTLE
 
 def main():
-    if len(sys.argv) < 3:
-        print("Usage: uploader_a1_acia.py <binary_file> <start_addr_hex> [port] [baud]")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(description="Upload binary file to memory via ACIA loader.")
+    parser.add_argument("binary_file", help="File to upload")
+    parser.add_argument("start_addr", help="Start address in hex, e.g. 300")
+    parser.add_argument("port", nargs="?", default="/dev/ttyS0", help="Serial port (default: /dev/ttyS0)")
+    parser.add_argument("baud", nargs="?", type=int, default=28800, help="Baud rate (default: 28800)")
+    parser.add_argument("--fast", action="store_true", help="Send in blocks at line rate, block size calibrated by a probe")
+    parser.add_argument("--block", type=int, help="With --fast, block size instead of calibration, 0 for no gaps")
+    parser.add_argument("--settle", type=float, default=SETTLE, help=f"Seconds between loader commands (default: {SETTLE})")
+    parser.add_argument("--verify", action="store_true", help="Read data back, upload again ranges whose checksums differ")
+    parser.add_argument("--retries", type=int, default=3, help="With --verify, rounds of uploading differing ranges again (default: 3)")
+    args = parser.parse_args()
 
-    filename = sys.argv[1]
-    start_addr_str = sys.argv[2]
-    serial_port = "/dev/ttyS0" if len(sys.argv) < 4 else sys.argv[3]
-    baud_rate = 28800 if len(sys.argv) < 5 else int(sys.argv[4])
-    
     try:
-        start_addr = int(start_addr_str, 16)
+        start_addr = int(args.start_addr, 16)
     except ValueError:
-        print(f"Error: invalid start address '{start_addr_str}' (must be hex, e.g. 300).")
+        print(f"Error: invalid start address '{args.start_addr}' (must be hex, e.g. 300).")
         sys.exit(1)
 
-    if not os.path.isfile(filename):
-        print(f"Error: file '{filename}' not found.")
+    if not os.path.isfile(args.binary_file):
+        print(f"Error: file '{args.binary_file}' not found.")
         sys.exit(1)
 
-    file_size = os.path.getsize(filename)
-    end_addr = start_addr + file_size
-    checksum = 0     
-
-    with open(filename, "rb") as f:
+    with open(args.binary_file, "rb") as f:
         data = f.read()
+    end_addr = start_addr + len(data)
+    if not data or end_addr > 0x10000:
+        print(f"Error: file does not fit in memory from {start_addr:04X}.")
+        sys.exit(1)
+    checksum = checksum16(data)
 
-    print(f"Using port {serial_port} at {baud_rate} baud")
-    
-    try:
-        with serial.Serial(serial_port, baud_rate, timeout=None) as ser:
-            # Send 
-            ser.write('r'.encode())
-            time.sleep(0.005)  # 5ms delay per byte
-
-            # Prepare bytes: start low, start high, end low, end high
-            addresses = [
-                start_addr & 0xFF,
-                (start_addr >> 8) & 0xFF,
-                end_addr & 0xFF,
-                (end_addr >> 8) & 0xFF,
-            ]
-
-            # Send address bytes
-            for b in addresses:
-                ser.write(bytes([b]))
-                time.sleep(0.005)  # 5ms delay per byte
-
-            # Send file data
-            start = time.time()
-            for b in data:
-                ser.write(bytes([b]))
-                checksum = (checksum + b) & 0xFFFF
-                time.sleep(0.002)  # 1ms delay per byte
-            end = time.time()
+    print(f"Using port {args.port} at {args.baud} baud")
 
-            bps = len(data) * 10 / (end - start)   # approximate bit rate (8N1)
-            print(f"Send {len(data)} bytes in {end - start:.2f}s " f"≈ {bps:.0f} baud")
+    try:
+        with connect(args.port, args.baud, timeout=None) as ser:
+            block, delay = 0, BYTE_DELAY
+            if args.fast:
+                delay = None
+                block = args.block
+                if block is None:
+                    block = calibrate(ser, data, start_addr, args.baud, args.settle)
+                    if block is None:
+                        print("Error: loader lost bytes at every pace, upload without --fast.")
+                        sys.exit(1)
 
-            # Optionally flush if needed
-            ser.flush()
+            if args.verify:
+                elapsed, differing = verified_upload(ser, data, start_addr, args.baud, block, delay,
+                                                     args.retries, args.settle)
+            else:
+                elapsed, differing = upload(ser, data, start_addr, args.baud, block, delay), []
+            print(f"Send {len(data)} bytes in {elapsed:.2f}s " f"≈ {effective_baud(len(data), elapsed):.0f} baud")
             print(f"Address range: {start_addr:04X}-{end_addr:04X}, checksum: {checksum:04X}")
+            if differing:
+                print(f"Error: read back still differs in {describe(differing, start_addr)}.")
+                sys.exit(1)
+            if args.verify:
+                print("Verified.")
             print("Upload complete.")
 
+    except RuntimeError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
     except serial.SerialException as e:
         print(f"Error opening/using serial port: {e}")
         sys.exit(1)
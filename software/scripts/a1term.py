@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Echo-paced typing into Apple-1 over the terminal serial port, shared by
+upload_a1.py and download_a1.py.
+
+Apple-1 takes one key at a time, so the next character is sent as soon as
+the previous one is echoed back, instead of after a fixed worst case delay.
+After CR the line is done when the program is ready for the next one, e.g.
+WozMon printed its closing CR (wozmon_ready). Echo which does not arrive
+in CHAR_TIMEOUT is taken as lost, after ECHO_MISSES of them in a row the
+terminal is assumed not to echo and fixed delays are used from then on.
+
+Usage:
+    from a1term import Terminal, wozmon_ready
+
+    term = Terminal(ser)
+    for line in lines:
+        term.send_line(line, wozmon_ready(line))
+"""
+
+import re
+import time
+
+CHAR_TIMEOUT = 0.5      # seconds to wait for echo of a character
+LINE_TIMEOUT = 2        # seconds to wait for the program after CR
+ECHO_MISSES = 3         # echoes missed in a row before falling back to delays
+CHAR_DELAY = 0.05       # seconds per character without echo
+LINE_DELAY = 0.2        # seconds per line without echo
+POLL = 0.001            # seconds between serial polls
+
+CR = b'\r'
+ESCAPE = b'\\'          # WozMon prompt after an invalid or too long line
+
+ADDRESS_LINE = re.compile(r"^\s*[0-9A-Fa-f]+")
+
+
+def wozmon_ready(line):
+    """
+    Condition of WozMon being ready after line, for Terminal.send_line().
+
+    WozMon echoes CR and prints one more after every line. Line starting with
+    an address prints the address and its content first, on a new line. Run
+    command prints the address only, then the program takes over.
+    """
+    if line.rstrip().upper().endswith("R"):
+        expected = 2
+    else:
+        expected = 3 if ADDRESS_LINE.match(line) else 2
+
+    def ready(output):
+        return output.count(CR) >= expected or ESCAPE in output
+    return ready
+
+
+class Terminal:
+    """Apple-1 keyboard and display over serial port"""
+
+    def __init__(self, ser, log=None):
+        """
+        Args:
+            ser: open serial port
+            log: callable receiving lines sent ("TX: ..."), None for quiet
+        """
+        self.ser = ser
+        self.log = log
+        self.buffer = bytearray()
+        self.misses = 0
+        self.chars = 0
+        self.echoes = 0
+
+    @property
+    def echoing(self):
+        return self.misses < ECHO_MISSES
+
+    def receive(self):
+        """Move bytes waiting in the port to the buffer, returns number of bytes"""
+        waiting = self.ser.in_waiting
+        if waiting:
+            self.buffer += self.ser.read(waiting)
+        return waiting
+
+    def wait(self, condition, timeout):
+        """
+        Receive until condition(buffer) holds.
+
+        Returns:
+            True if condition held in time
+        """
+        deadline = time.monotonic() + timeout
+        while not condition(self.buffer):
+            if time.monotonic() >= deadline:
+                return False
+            if not self.receive():
+                time.sleep(POLL)
+        return True
+
+    def take(self):
+        """Return and clear everything received so far"""
+        self.receive()
+        data = bytes(self.buffer)
+        self.buffer.clear()
+        return data
+
+    def send_char(self, char):
+        """
+        Send one character, wait for its echo.
+
+        Returns:
+            True if echoed
+        """
+        key = char.upper().encode('ascii')
+        self.ser.write(key)
+        self.chars += 1
+        if not self.echoing:
+            time.sleep(CHAR_DELAY)
+            return False
+
+        start = len(self.buffer)
+        if self.wait(lambda buffer: key in buffer[start:], CHAR_TIMEOUT):
+            self.misses = 0
+            self.echoes += 1
+            # Drop everything up to the echo so it is not matched again
+            del self.buffer[:self.buffer.index(key, start) + 1]
+            return True
+        self.misses += 1
+        return False
+
+    def send_line(self, line, ready=None, timeout=LINE_TIMEOUT):
+        """
+        Type line followed by CR.
+
+        Args:
+            ready: condition(output received after CR) of the program being
+                ready for the next line, None to return after CR echo
+            timeout: seconds to wait for ready
+
+        Returns:
+            output received after CR (CR echo included), None if ready did
+            not hold in time
+        """
+        if self.log:
+            self.log(f"TX: {line}")
+        for char in line:
+            self.send_char(char)
+        self.buffer.clear()
+        self.ser.write(CR)
+        self.chars += 1
+        if not self.echoing:
+            time.sleep(LINE_DELAY)
+            return self.take()
+        if ready is None:
+            ready = lambda output: CR in output
+        if not self.wait(ready, timeout):
+            self.take()
+            return None
+        return self.take()
@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+"""
+Host side of the ACIA loader protocol (loader.asm), shared by upload/download
+scripts and loader scripts, other directories link to this file.
+
+Loader reads a command byte ('r' - receive into memory, 't' - transmit from
+memory) and start/stop addresses (stop is exclusive), echoing to the display
+in between, hence the delays in the header. Data bytes are stored by a tight
+loop polling the ACIA, which has no FIFO: a byte received before the previous
+one was taken is lost. After a transfer the loader computes the checksum and
+prints it, so the next command must wait a bit (settle).
+
+Fast upload sends data in blocks followed by a gap of GAP_BYTES byte times.
+Block size is calibrated by a probe: head of the data is uploaded at a pace,
+read back with 't' and compared, the fastest pace that round-trips wins.
+Loader which lost bytes of a probe still waits for them, resync() feeds it
+until it answers a command again.
+
+Verified transfers read the range back and compare checksum16 of every
+CHECK_SIZE bytes, only mismatching sub-ranges are transferred again.
+
+Usage:
+    from acia import calibrate, verified_upload
+
+    block = calibrate(ser, data, 0x0300, 28800)
+    elapsed, differing = verified_upload(ser, data, 0x0300, 28800, block)
+"""
+
+import time
+
+from checksum16 import checksum16
+
+HEADER_DELAY = 0.005    # seconds after each header byte, loader echoes to display
+BYTE_DELAY = 0.002      # seconds after each data byte in default (slow) mode
+SETTLE = 0.2            # seconds for the loader to print result before next command
+BYTE_BITS = 10          # 8N1
+PROBE_SIZE = 256        # bytes uploaded and read back by calibration
+GAP_BYTES = 2           # pause after each block in byte times
+PACES = (0, 256, 64, 16, 4, 1)  # block sizes tried by calibration, 0 - no gaps
+SYNC_ADDR = 0xFF00      # WozMon ROM, read by resync(), no address byte is 'r' or 't'
+SYNC_TIMEOUT = 0.1      # seconds to wait for the answer to resync command
+SYNC_ATTEMPTS = 10      # resync commands, each shifts command grouping by one byte
+CHECK_SIZE = 256        # bytes covered by one checksum in verified transfers
+
+
+def byte_time(baud_rate):
+    """Seconds one byte takes on the line"""
+    return BYTE_BITS / baud_rate
+
+
+def effective_baud(size, elapsed):
+    """Approximate bit rate of a transfer (8N1)"""
+    return size * BYTE_BITS / elapsed if elapsed > 0 else 0
+
+
+def send_header(ser, command, start, stop):
+    """Send command byte and start/stop addresses, little endian"""
+    ser.write(command)
+    time.sleep(HEADER_DELAY)
+    for b in (start & 0xFF, (start >> 8) & 0xFF, stop & 0xFF, (stop >> 8) & 0xFF):
+        ser.write(bytes([b]))
+        time.sleep(HEADER_DELAY)
+
+
+def send_data(ser, data, baud_rate, block=0, delay=None):
+    """
+    Send data bytes.
+
+    Args:
+        block: bytes sent back to back before a gap of GAP_BYTES byte times,
+            0 - no gaps
+        delay: seconds after each byte instead of blocks, legacy pace
+
+    Returns:
+        seconds elapsed until the last byte left the host
+    """
+    view = memoryview(data)
+    start = time.monotonic()
+    if delay is not None:
+        for i in range(len(view)):
+            ser.write(view[i:i + 1])
+            time.sleep(delay)
+    elif block == 0:
+        ser.write(view)
+    else:
+        gap = GAP_BYTES * byte_time(baud_rate)
+        for offset in range(0, len(view), block):
+            ser.write(view[offset:offset + block])
+            ser.flush()
+            time.sleep(gap)
+    ser.flush()
+    return time.monotonic() - start
+
+
+def upload(ser, data, start, baud_rate, block=0, delay=None):
+    """
+    Upload data to memory at start with 'r' command.
+
+    Returns:
+        seconds elapsed sending the data
+    """
+    send_header(ser, b'r', start, start + len(data))
+    return send_data(ser, data, baud_rate, block, delay)
+
+
+def download(ser, start, stop, baud_rate, timeout=1):
+    """
+    Read memory range start..stop (exclusive) with 't' command.
+
+    Args:
+        timeout: seconds to wait for the first byte, transfer time is added
+
+    Returns:
+        bytes received, shorter than the range if loader went silent
+    """
+    length = stop - start
+    saved_timeout = ser.timeout
+    ser.timeout = timeout + 2 * length * byte_time(baud_rate)
+    try:
+        ser.reset_input_buffer()
+        send_header(ser, b't', start, stop)
+        return ser.read(length)
+    finally:
+        ser.timeout = saved_timeout
+
+
+def resync(ser, baud_rate, pending, settle=SETTLE):
+    """
+    Bring loader which lost bytes back to waiting for a command.
+
+    Loader lacking bytes of an upload stores whatever comes next, so pending
+    zero bytes are sent first, at the default pace not to lose them too.
+    Loader takes the surplus as commands in groups of 5 bytes (command,
+    4 address bytes), zero command is ignored. Command reading SYNC_ADDR is
+    sent then, with one more zero byte every time, which shifts the grouping,
+    until the loader answers. None of its bytes is 'r' or 't' except the
+    command itself, so misaligned groups are ignored too.
+
+    Args:
+        pending: upper bound of bytes the loader waits for
+
+    Returns:
+        True if loader answered
+    """
+    send_data(ser, bytes(pending), baud_rate, delay=BYTE_DELAY)
+    time.sleep(settle)
+    for attempt in range(SYNC_ATTEMPTS):
+        if attempt:
+            ser.write(b'\x00')
+            time.sleep(HEADER_DELAY)
+        if download(ser, SYNC_ADDR, SYNC_ADDR + 1, baud_rate, SYNC_TIMEOUT):
+            time.sleep(settle)
+            return True
+    return False
+
+
+def calibrate(ser, data, start, baud_rate, settle=SETTLE, quiet=False):
+    """
+    Find the largest block size the loader absorbs without losing bytes.
+
+    Head of data (PROBE_SIZE bytes) is uploaded to its own address at every
+    pace from PACES, fastest first, and read back until it matches. Probe is
+    overwritten by the upload which follows.
+
+    Returns:
+        block size for upload()/send_data(), None if no pace round-trips
+
+    Raises:
+        RuntimeError: loader lost bytes and does not answer any more
+    """
+    probe = bytes(data[:PROBE_SIZE])
+    for block in PACES:
+        if block >= len(probe):
+            continue  # same as no gaps for a short probe
+        upload(ser, probe, start, baud_rate, block)
+        time.sleep(settle)
+        ok = download(ser, start, start + len(probe), baud_rate) == probe
+        time.sleep(settle)
+        if not quiet:
+            pace = "no gaps" if block == 0 else f"{block} byte blocks"
+            print(f"Probe {len(probe)} bytes, {pace}: {'ok' if ok else 'failed'}")
+        if ok:
+            return block
+        if not resync(ser, baud_rate, len(probe), settle):
+            raise RuntimeError("loader does not answer after lost bytes, reset the board")
+    return None
+
+
+def mismatches(data, received, check_size=CHECK_SIZE):
+    """
+    Compare data with bytes read back, checksum16 of every check_size bytes.
+
+    Returns:
+        list of (offset, end) ranges of data which differ, adjacent ranges
+        joined, bytes missing from received count as different
+    """
+    ranges = []
+    for offset in range(0, len(data), check_size):
+        end = min(offset + check_size, len(data))
+        if end <= len(received) and checksum16(data[offset:end]) == checksum16(received[offset:end]):
+            continue
+        if ranges and ranges[-1][1] == offset:
+            ranges[-1] = (ranges[-1][0], end)
+        else:
+            ranges.append((offset, end))
+    return ranges
+
+
+def describe(ranges, start):
+    """Ranges as addresses for messages"""
+    return ", ".join(f"{start + offset:04X}-{start + end:04X}" for offset, end in ranges)
+
+
+def verified_upload(ser, data, start, baud_rate, block=0, delay=None, retries=3, settle=SETTLE, quiet=False):
+    """
+    Upload data, read it back and upload again only ranges whose checksums differ.
+
+    Ranges are uploaded again at the default pace, so the loader which loses
+    bytes at a fast pace gets them at last.
+
+    Args:
+        block, delay: pace of the first upload, as for send_data()
+        retries: rounds of uploading mismatching ranges again
+
+    Returns:
+        (seconds elapsed by the first upload, list of (offset, end) ranges still differing)
+
+    Raises:
+        RuntimeError: loader lost bytes and does not answer any more
+    """
+    view = memoryview(data)
+    ranges = [(0, len(data))]
+    elapsed = None
+    for attempt in range(retries + 1):
+        for offset, end in ranges:
+            seconds = upload(ser, view[offset:end], start + offset, baud_rate, block, delay)
+            elapsed = seconds if elapsed is None else elapsed
+            time.sleep(settle)
+
+        differing = []
+        for offset, end in ranges:
+            received = download(ser, start + offset, start + end, baud_rate)
+            time.sleep(settle)
+            if len(received) < end - offset and not resync(ser, baud_rate, end - offset, settle):
+                raise RuntimeError("loader does not answer after lost bytes, reset the board")
+            differing += [(offset + a, offset + b) for a, b in mismatches(view[offset:end], received)]
+        if not differing:
+            return elapsed, []
+        if not quiet:
+            print(f"Read back differs in {describe(differing, start)}", end="")
+            print(", uploading again." if attempt < retries else ".")
+        ranges = differing
+        block, delay = 0, BYTE_DELAY
+    return elapsed, ranges
+
+
+def verified_download(ser, start, stop, baud_rate, retries=3, settle=SETTLE, data=None, quiet=False):
+    """
+    Read memory range, read it again and read again ranges whose checksums differ.
+
+    Args:
+        data: result of the first download() if done already
+
+    Returns:
+        (data, list of (offset, end) ranges where the last two reads disagree)
+    """
+    if data is None:
+        data = download(ser, start, stop, baud_rate)
+        time.sleep(settle)
+    data = bytearray(data)
+    data.extend(bytes(stop - start - len(data)))
+    ranges = [(0, stop - start)]
+    for attempt in range(retries + 1):
+        differing = []
+        for offset, end in ranges:
+            received = download(ser, start + offset, start + end, baud_rate)
+            time.sleep(settle)
+            differing += [(offset + a, offset + b) for a, b in mismatches(data[offset:end], received)]
+            data[offset:offset + len(received)] = received
+        if not differing:
+            return data, []
+        if not quiet and attempt < retries:
+            print(f"Reads differ in {describe(differing, start)}, reading again.")
+        ranges = differing
+    return data, ranges
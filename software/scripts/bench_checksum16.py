@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark of checksum16 against the per-byte loops it replaced.
+
+Usage: bench_checksum16.py [repeat]
+"""
+
+import os
+import sys
+import time
+
+import checksum16
+
+
+def loop_modulo(data):
+    """Loop from calculate_checksum() in datasette_chunks.py"""
+    checksum = 0
+    for byte in data:
+        checksum = (checksum + byte) % 65536
+    return checksum
+
+
+def loop_mask(data):
+    """Loop from upload_acia.py / download_acia.py"""
+    checksum = 0
+    for b in data:
+        checksum = (checksum + b) & 0xFFFF
+    return checksum
+
+
+def bench(func, data, repeat):
+    """Best time of repeat runs, in seconds"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(data)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+
+    candidates = [
+        ('per-byte % 65536', loop_modulo),
+        ('per-byte & 0xFFFF', loop_mask),
+        ('sum(memoryview)', lambda data: sum(memoryview(data)) & 0xFFFF),
+        ('checksum16', checksum16.checksum16),
+    ]
+    if checksum16.np is not None:
+        np = checksum16.np
+        candidates.append(('numpy sum', lambda data: int(np.frombuffer(data, dtype=np.uint8).sum(dtype=np.uint64)) & 0xFFFF))
+    else:
+        print("NumPy not installed, checksum16 uses builtin sum() only")
+
+    for size in (32 * 1024, 1024 * 1024):
+        data = os.urandom(size)
+        print(f"\n{size // 1024} KB input, best of {repeat}:")
+        reference = None
+        for name, func in candidates:
+            seconds, result = bench(func, data, repeat)
+            reference = result if reference is None else reference
+            status = '' if result == reference else '  WRONG RESULT'
+            print(f"  {name:<20} {seconds * 1000:9.3f} ms  {size / seconds / 1e6:9.1f} MB/s{status}")
+
+
+if __name__ == '__main__':
+    main()
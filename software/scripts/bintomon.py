@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Encode binary file as WozMon deposit lines, e.g. for upload_a1.py.
+
+Lines are packed up to the length of the Apple-1 input buffer: the first
+line of a run sets the address ("300:A9 0 85"), following lines continue
+where the previous one stopped (":20 EF FF"). Bytes are written without
+leading zero. Runs of bytes equal to the baseline (what memory holds
+already, e.g. zeros) are skipped when a new address line is shorter than
+the run. Last line runs the program ("300R").
+
+Usage:
+    bintomon.py -l 0x0300 -r- program.bin >program.mon
+    bintomon.py -l 0x0300 --baseline 00 program.bin >program.mon
+"""
+
+import argparse
+import sys
+
+LINE_LENGTH = 127   # WozMon input buffer is 128 bytes including CR
+
+
+def parse_address(text):
+    """Hex address, with or without 0x prefix"""
+    value = int(text, 16)
+    if not 0 <= value <= 0xFFFF:
+        raise ValueError(f"address out of range: {text}")
+    return value
+
+
+def hex_byte(value, short=True):
+    return f"{value:X}" if short else f"{value:02X}"
+
+
+def baseline_runs(data, baseline, start_cost, short=True):
+    """
+    Ranges of data worth sending, runs matching baseline left out.
+
+    Args:
+        baseline: sequence of the same length as data, None items match nothing,
+            or None for no baseline
+        start_cost: chars a new address line takes more than continuing current line
+
+    Returns:
+        list of (offset, end)
+    """
+    if baseline is None:
+        return [(0, len(data))] if data else []
+    ranges = []
+    offset = 0
+    while offset < len(data):
+        # Skip leading run, it costs nothing
+        while offset < len(data) and data[offset] == baseline[offset]:
+            offset += 1
+        if offset == len(data):
+            break
+        end = offset
+        while end < len(data):
+            if data[end] != baseline[end]:
+                end += 1
+                continue
+            run = end
+            while run < len(data) and data[run] == baseline[run]:
+                run += 1
+            # Bytes of the run with separators against new address line
+            if run == len(data) or sum(len(hex_byte(b, short)) + 1 for b in data[end:run]) > start_cost:
+                break
+            end = run
+        ranges.append((offset, end))
+        offset = end
+    return ranges
+
+
+def encode(data, load, run=None, baseline=None, line_length=LINE_LENGTH, short=True):
+    """
+    Encode data as WozMon lines.
+
+    Args:
+        data: bytes-like to deposit at load address
+        load: load address
+        run: address to run at the end, None for no run line
+        baseline: memory content at load address (sequence of the same length
+            as data, None for unknown bytes), runs matching it are skipped
+        line_length: chars per line without CR
+        short: hex bytes without leading zero
+
+    Returns:
+        list of lines without line terminators
+    """
+    if load + len(data) > 0x10000:
+        raise ValueError(f"data does not fit in memory from {load:04X}")
+    # Address, colon and CR ending the previous line
+    start_cost = len(f"{load + len(data):X}:") + 1
+    lines = []
+    for offset, end in baseline_runs(data, baseline, start_cost, short):
+        line = f"{load + offset:X}:"
+        for value in data[offset:end]:
+            token = hex_byte(value, short)
+            if not line.endswith(":"):
+                token = " " + token
+            if len(line) + len(token) > line_length:
+                lines.append(line)
+                line = ":" + token.lstrip()
+            else:
+                line += token
+        lines.append(line)
+    if run is not None:
+        lines.append(f"{run:X}R")
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Encode binary file as WozMon deposit lines.")
+    parser.add_argument("binary_file", help="File to encode")
+    parser.add_argument("-l", "--load", required=True, help="Load address in hex, e.g. 0x0300")
+    parser.add_argument("-r", "--run", help="Run address in hex, '-' for load address (default: no run line)")
+    parser.add_argument("-o", "--output", help="Output file (default: stdout)")
+    parser.add_argument("--baseline", help="Skip runs of this byte (hex), e.g. 00 for cleared memory")
+    parser.add_argument("--baseline-file", help="Skip runs matching memory dump from load address, e.g. by download_acia.py")
+    parser.add_argument("--line-length", type=int, default=LINE_LENGTH, help=f"Chars per line (default: {LINE_LENGTH})")
+    parser.add_argument("--no-short-hex", action="store_true", help="Two hex digits per byte")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Print statistics to stderr")
+    args = parser.parse_args()
+
+    try:
+        load = parse_address(args.load)
+        run = None if args.run is None else load if args.run == "-" else parse_address(args.run)
+        with open(args.binary_file, "rb") as f:
+            data = f.read()
+        baseline = None
+        if args.baseline is not None:
+            baseline = bytes([int(args.baseline, 16)]) * len(data)
+        elif args.baseline_file:
+            with open(args.baseline_file, "rb") as f:
+                baseline = list(f.read(len(data)))
+            # Memory beyond the dump is unknown
+            baseline += [None] * (len(data) - len(baseline))
+        lines = encode(data, load, run, baseline, args.line_length, not args.no_short_hex)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+
+    text = "".join(line + "\n" for line in lines)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    else:
+        sys.stdout.write(text)
+
+    if args.verbose:
+        print(f"{len(data)} bytes at {load:04X}, {len(lines)} lines, {len(text)} chars", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -9,5 +9,5 @@ NAME="${FILENAME%%#*}"
 START="${FILENAME#*#}"
 START="${START:2}"
 
-bintomon -l 0x$START -r- $FILENAME >$NAME.mon
+"$(dirname "$0")/bintomon.py" -l 0x$START -r- "$FILENAME" >"$NAME.mon"
 
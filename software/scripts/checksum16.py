@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+16-bit additive checksum (sum of all bytes modulo 65536), as calculated by
+the loader (do_checksum in loader.asm), DSSH and the datasette tools.
+
+Shared by upload/download scripts, loader scripts and datasette tools, other
+directories link to this file.
+
+Usage:
+    from checksum16 import Checksum16, checksum16
+
+    c = Checksum16()
+    c.update(chunk1)
+    c.update(chunk2)
+    print(f"{c.digest():04X}")
+"""
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Below this size builtin sum() beats NumPy call overhead
+NUMPY_THRESHOLD = 1024
+
+
+def byte_sum(data):
+    """
+    Sum of all bytes of a bytes-like object (bytes, bytearray, memoryview, mmap).
+
+    Args:
+        data: bytes-like object
+
+    Returns:
+        sum as unbounded integer
+    """
+    view = memoryview(data).cast('B')
+    if np is not None and len(view) >= NUMPY_THRESHOLD:
+        return int(np.frombuffer(view, dtype=np.uint8).sum(dtype=np.uint64))
+    return sum(view)
+
+
+class Checksum16:
+    """Streaming 16-bit additive checksum"""
+
+    def __init__(self, data=None):
+        self.value = 0
+        if data is not None:
+            self.update(data)
+
+    def update(self, data):
+        """Add bytes to checksum, returns self"""
+        self.value = (self.value + byte_sum(data)) & 0xFFFF
+        return self
+
+    def digest(self):
+        """Checksum value, 0..65535"""
+        return self.value
+
+    def hexdigest(self):
+        """Checksum as 4 hex digits, as printed by the loader"""
+        return f"{self.value:04X}"
+
+
+def checksum16(data):
+    """16-bit additive checksum of a bytes-like object"""
+    return byte_sum(data) & 0xFFFF
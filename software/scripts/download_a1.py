@@ -3,65 +3,104 @@
 import serial
 import time
 import sys, re
+from transport import connect
+from a1term import Terminal
+
+PROMPT = ">"            # BASIC prompt, printed when LIST is done
+PROMPT_QUIET = 0.05     # seconds without data after prompt
+IDLE_TIMEOUT = 3        # seconds without data when the prompt does not come
+
+NUMBERED_LINE = re.compile(r"^\s*\d+")
+
+class LineAssembler:
+    """Split received text into lines, a line may arrive in several reads"""
+
+    def __init__(self):
+        self.partial = ""
+
+    def feed(self, text):
+        """Add text, return list of lines completed by it"""
+        lines = re.split(r"[\r\n]", self.partial + text)
+        self.partial = lines.pop()
+        return lines
+
+class BasicListing:
+    """Write BASIC lines as they are listed, joining lines wrapped by the terminal"""
+
+    def __init__(self, f):
+        self.f = f
+        self.line = None
+        self.count = 0
+
+    def add(self, line):
+        # Trailing spaces are kept until the line is complete, wrap may fall on a space
+        if line.strip() in ("", "LIST", PROMPT):
+            return
+        if NUMBERED_LINE.match(line):
+            self.flush()
+            self.line = line
+        elif self.line is not None:
+            self.line += line.lstrip()
+
+    def flush(self):
+        """Write the line, it is complete once the next one starts"""
+        if self.line is not None:
+            self.f.write(("\n" if self.count else "") + self.line.rstrip())
+            self.f.flush()
+            self.count += 1
+            self.line = None
+
+    def close(self):
+        self.flush()
 
 def capture_serial_output(port, baudrate, output_file, lines):
     """Capture Apple-1 output from serial after sending a command."""
-    with serial.Serial(port, baudrate, timeout=1) as ser:
-        print("Waiting for 'RC6502 Apple 1 Replica'...")
-        
-        # Wait for the presentation string
-        while True:
-            if ser.in_waiting > 0:
-                response = ser.read(ser.in_waiting).decode('ascii', errors='ignore')
-                print(f"RX: {response}", end='')
-                if "RC6502 Apple 1 Replica" in response:
-                    break
-                time.sleep(0.1)
-        
-        time.sleep(1)
+    with connect(port, baudrate, timeout=PROMPT_QUIET) as ser:
+        if not ser.reused:
+            print("Waiting for 'RC6502 Apple 1 Replica'...")
+
+            # Wait for the presentation string, it may arrive in several reads
+            banner = ""
+            while "RC6502 Apple 1 Replica" not in banner:
+                if ser.in_waiting > 0:
+                    response = ser.read(ser.in_waiting).decode('ascii', errors='ignore')
+                    print(f"RX: {response}", end='')
+                    banner += response
+                else:
+                    time.sleep(0.1)
+
+            time.sleep(1)
+        term = Terminal(ser, log=print)
+        output = b""
         for line in lines:
-            for char in line + "\r":  # Add CR to the end of each line
-                ser.write(char.encode('ascii'))
-                time.sleep(0.1)  # 100 ms per character to avoid overflow
-            print(f"TX: {line}", end='')
-            time.sleep(2)  # 500 ms per line to avoid overflow
-
-        collected_lines = []
-        last_received_time = time.time()
-        
-        # Capture response
-        done = False
-        while not done:
-            if ser.in_waiting > 0:
-                response = ser.read(ser.in_waiting).decode('ascii', errors='ignore').replace('\r', '\n')
-                print(f"RX: {response}", end='')
-                last_received_time = time.time()
-                
-                for line in response.split("\n"):
-                    line = line.rstrip()  
-                    collected_lines.append(line)
-                
-            if time.time() - last_received_time > 3:
-                print("Timeout reached. Stopping capture.")
-                break  # Stop capturing when timeout is reached
-            
-            time.sleep(0.1)  # Prevent CPU overload
-        
-        # Write collected lines to file
-        first = True
+            output = term.send_line(line) or b""
+
+        # Capture response, lines are written as they arrive
         with open(output_file, "w") as f:
-            for line in collected_lines:
-                if line == "LIST" or line == ">":
+            listing = BasicListing(f)
+            assembler = LineAssembler()
+            last_received_time = time.time()
+            while True:
+                data = output + ser.read(ser.in_waiting or 1)
+                output = b""
+                if data:
+                    text = data.decode('ascii', errors='ignore')
+                    print(text.replace('\r', '\n'), end='', flush=True)
+                    last_received_time = time.time()
+                    for line in assembler.feed(text):
+                        listing.add(line)
                     continue
-                if line and re.match(r"^\s*\d+", line):
-                    if not first:
-                        f.write("\n")
-                    f.write(line)
-                else:
-                    f.write("" + line.lstrip())
-                first = False
-                        
-        print("Capture complete. Data saved to:", output_file)
+                # Prompt is not followed by CR, it waits for input
+                if assembler.partial.strip() == PROMPT:
+                    break
+                if time.time() - last_received_time > IDLE_TIMEOUT:
+                    print("Timeout reached. Stopping capture.")
+                    break
+            if assembler.partial.strip() != PROMPT:
+                listing.add(assembler.partial)
+            listing.close()
+
+        print(f"\nCapture complete, {listing.count} lines. Data saved to:", output_file)
 
 if __name__ == "__main__":
     if len(sys.argv) < 2:
@@ -0,0 +1,348 @@
+#!/usr/bin/env python3
+"""
+Serial transport shared by upload/download scripts, loader scripts, datasette
+tools and flash bulk utils, other directories link to this file.
+
+connect() opens either the serial port itself or a session with the
+transport daemon, which keeps the port open between tool runs. Board reset
+on open and the waits that follow happen once, when the daemon starts.
+Sessions are exclusive, a second tool waits until the first one disconnects.
+
+Port names:
+    /dev/ttyUSB1, loop://     - opened directly with pyserial
+    unix:/tmp/rc6502.sock     - session with the daemon listening on that socket
+
+Daemon:
+    transport.py serve --port /dev/ttyUSB1 --baudrate 250000 [--socket /tmp/rc6502.sock]
+    transport.py serve --pty [--loopback]
+
+Backend --pty creates a pseudo-terminal instead of opening a port, device
+emulator attaches to its slave side printed on start. With --loopback the
+daemon echoes everything back itself, for testing tools without hardware.
+
+Usage:
+    from transport import connect
+
+    with connect(args.port, 28800, timeout=1) as ser:
+        wait_ready(ser, probe=b'?', reply=b'!')  # board resets on open
+        ser.write(b'r')
+"""
+
+import argparse
+import os
+import select
+import selectors
+import socket
+import sys
+import threading
+import time
+import tty
+from collections import deque
+
+import serial
+
+SOCKET_PREFIX = "unix:"
+DEFAULT_SOCKET = "/tmp/rc6502.sock"
+BUFFER_SIZE = 4096
+READY_TIMEOUT = 3       # seconds, longest reset and start-up of our boards
+READY_IDLE = 0.05       # seconds of silence after the probe reply
+BANNER_IDLE = 0.5       # seconds of silence ending the banner, printed in parts during start-up
+PROBE_INTERVAL = 0.1    # seconds between probes
+
+
+class SocketTransport:
+    """Session with transport daemon, the subset of serial.Serial API used by our tools"""
+
+    reused = True
+
+    def __init__(self, path, timeout=None):
+        self.path = path
+        self.timeout = timeout
+        self.buffer = bytearray()
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            self.sock.connect(path)
+        except OSError as e:
+            self.sock.close()
+            raise serial.SerialException(f"cannot connect to transport daemon at {path}: {e}")
+
+    @property
+    def is_open(self):
+        return self.sock is not None
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def _receive(self, wait):
+        """Receive into buffer, wait seconds at most (None - until something arrives)"""
+        ready, _, _ = select.select([self.sock], [], [], wait)
+        if not ready:
+            return False
+        data = self.sock.recv(BUFFER_SIZE)
+        if not data:
+            raise serial.SerialException("transport daemon closed the session")
+        self.buffer.extend(data)
+        return True
+
+    @property
+    def in_waiting(self):
+        while self._receive(0):
+            pass
+        return len(self.buffer)
+
+    def read(self, size=1):
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        while len(self.buffer) < size:
+            wait = None if deadline is None else max(0, deadline - time.monotonic())
+            if not self._receive(wait) and deadline is not None and time.monotonic() >= deadline:
+                break
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return data
+
+    def readinto(self, b):
+        data = self.read(len(b))
+        n = len(data)
+        b[:n] = data
+        return n
+
+    def read_all(self):
+        return self.read(self.in_waiting)
+
+    def write(self, data):
+        try:
+            self.sock.sendall(data)
+        except OSError as e:
+            raise serial.SerialException(f"transport daemon session failed: {e}")
+        return len(data)
+
+    def flush(self):
+        """Data is handed over to the daemon by write() already"""
+
+    def reset_input_buffer(self):
+        self.in_waiting
+        self.buffer.clear()
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def connect(port, baudrate=9600, timeout=None, **kwargs):
+    """
+    Open serial port or daemon session.
+
+    Args:
+        port: device, pyserial URL or "unix:<socket path>" for the daemon
+        baudrate, timeout, kwargs: as for serial.Serial, ignored for daemon
+            sessions (daemon sets up the port)
+
+    Returns:
+        serial.Serial-like object, reused attribute is True if the port was
+        open already, so there is no board reset to wait for
+    """
+    if port.startswith(SOCKET_PREFIX):
+        return SocketTransport(port[len(SOCKET_PREFIX):], timeout)
+    ser = serial.serial_for_url(port, baudrate, timeout=timeout, **kwargs)
+    ser.reused = False
+    return ser
+
+
+def wait_ready(ser, timeout=READY_TIMEOUT, probe=None, reply=None):
+    """
+    Wait until device comes up after reset on open, instead of sleeping for fixed time.
+
+    Without probe, waits for the banner: returns once something was received
+    and the line went quiet for BANNER_IDLE. With probe, sends it repeatedly until reply is
+    received and the line went quiet. Device which neither prints banner nor
+    answers the probe is given the whole timeout, as a fixed sleep did.
+    Reused connection is ready already.
+
+    Args:
+        ser: port returned by connect()
+        timeout: seconds to wait at most
+        probe: bytes to send, no-op for the device
+        reply: bytes the device answers the probe with
+
+    Returns:
+        bytes received while waiting (banner, probe replies)
+    """
+    received = bytearray()
+    if ser.reused:
+        return bytes(received)
+    idle = READY_IDLE if probe is not None else BANNER_IDLE
+    deadline = time.monotonic() + timeout
+    answered = False
+    last_rx = None
+    next_probe = 0
+    while time.monotonic() < deadline:
+        now = time.monotonic()
+        if probe is not None and not answered and now >= next_probe:
+            ser.write(probe)
+            next_probe = now + PROBE_INTERVAL
+        waiting = ser.in_waiting
+        if waiting:
+            received += ser.read(waiting)
+            last_rx = time.monotonic()
+            answered = probe is None or reply in received
+        elif answered and now - last_rx >= idle:
+            # Replies to probes queued during start-up are drained as well
+            break
+        time.sleep(0.005)
+    # Bytes arriving late would be taken by the caller for the first reply
+    waiting = ser.in_waiting
+    while waiting:
+        received += ser.read(waiting)
+        waiting = ser.in_waiting
+    return bytes(received)
+
+
+class SerialBackend:
+    """Daemon backend owning a real serial port"""
+
+    def __init__(self, port, baudrate, xonxoff=False):
+        self.ser = serial.Serial(port, baudrate, xonxoff=xonxoff, timeout=0)
+        self.name = port
+
+    def fileno(self):
+        return self.ser.fileno()
+
+    def read(self):
+        return self.ser.read(BUFFER_SIZE)
+
+    def write(self, data):
+        self.ser.write(data)
+
+    def reset_input(self):
+        self.ser.reset_input_buffer()
+
+
+class PtyBackend:
+    """Daemon backend on a pseudo-terminal, device emulator attaches to the slave side"""
+
+    def __init__(self, loopback=False):
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.master)
+        tty.setraw(self.slave)
+        self.name = os.ttyname(self.slave)
+        if loopback:
+            threading.Thread(target=self.echo, daemon=True).start()
+
+    def echo(self):
+        while True:
+            data = os.read(self.slave, BUFFER_SIZE)
+            os.write(self.slave, data)
+
+    def fileno(self):
+        return self.master
+
+    def read(self):
+        return os.read(self.master, BUFFER_SIZE)
+
+    def write(self, data):
+        view = memoryview(data)
+        while view:
+            view = view[os.write(self.master, view):]
+
+    def reset_input(self):
+        while select.select([self.master], [], [], 0)[0]:
+            os.read(self.master, BUFFER_SIZE)
+
+
+def serve(backend, path):
+    """Relay bytes between backend and one client session at a time"""
+    if os.path.exists(path):
+        os.unlink(path)
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(path)
+    listener.listen(8)
+    print(f"Serving {backend.name} on {SOCKET_PREFIX}{path}", flush=True)
+
+    selector = selectors.DefaultSelector()
+    selector.register(listener, selectors.EVENT_READ, "accept")
+    selector.register(backend.fileno(), selectors.EVENT_READ, "port")
+    client = None
+    waiting = deque()
+
+    def start(conn):
+        nonlocal client
+        # Bytes received between sessions belong to nobody
+        backend.reset_input()
+        client = conn
+        selector.register(conn, selectors.EVENT_READ, "client")
+
+    def drop():
+        nonlocal client
+        selector.unregister(client)
+        client.close()
+        client = None
+        if waiting:
+            start(waiting.popleft())
+
+    try:
+        while True:
+            for key, _ in selector.select():
+                if key.data == "accept":
+                    conn, _ = listener.accept()
+                    if client is None:
+                        start(conn)
+                    else:
+                        waiting.append(conn)
+                elif key.data == "port":
+                    data = backend.read()
+                    if client is not None and data:
+                        try:
+                            client.sendall(data)
+                        except OSError:
+                            drop()
+                else:
+                    try:
+                        data = client.recv(BUFFER_SIZE)
+                    except OSError:
+                        data = b""
+                    if data:
+                        backend.write(data)
+                    else:
+                        drop()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        listener.close()
+        os.unlink(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serial transport daemon, keeps the port open between tool runs.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    serve_parser = sub.add_parser("serve", help="Own the port and serve sessions over Unix socket")
+    serve_parser.add_argument("--socket", default=DEFAULT_SOCKET, help=f"Socket path (default: {DEFAULT_SOCKET})")
+    backend_group = serve_parser.add_mutually_exclusive_group(required=True)
+    backend_group.add_argument("--port", help="Serial port, e.g. /dev/ttyUSB1")
+    backend_group.add_argument("--pty", action="store_true", help="Pseudo-terminal instead of a serial port")
+    serve_parser.add_argument("--baudrate", type=int, default=28800, help="Baud rate (default: 28800)")
+    serve_parser.add_argument("--xonxoff", action="store_true", help="Software flow control, e.g. for datasette")
+    serve_parser.add_argument("--loopback", action="store_true", help="With --pty, echo everything back")
+    args = parser.parse_args()
+
+    try:
+        if args.pty:
+            backend = PtyBackend(args.loopback)
+        else:
+            backend = SerialBackend(args.port, args.baudrate, args.xonxoff)
+    except (OSError, serial.SerialException) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+
+    serve(backend, args.socket)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
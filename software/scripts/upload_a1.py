@@ -3,51 +3,66 @@
 import serial
 import time
 import sys
+import argparse
+from transport import connect, wait_ready
+from a1term import Terminal, wozmon_ready
+from bintomon import encode, parse_address
 
 def send_to_serial(port, baudrate, wozmon_lines):
     """Send WozMon lines to the Apple-1 over a serial connection."""
 
-    with serial.Serial(port, baudrate, timeout=1) as ser:
-        timeout = time.time() + 3
-        while timeout > time.time():
-            if ser.in_waiting > 0:
-                response = ser.read(ser.in_waiting).decode('ascii', errors='ignore')
-                print(f"RX: {response}")
+    with connect(port, baudrate, timeout=1) as ser:
+        banner = wait_ready(ser)
+        if banner:
+            print(f"RX: {banner.decode('ascii', errors='ignore')}")
 
+        term = Terminal(ser, log=print)
+        start = time.time()
+        failed = 0
         for line in wozmon_lines:
-            for char in line + "\r":  # Add CR to the end of each line
-                ser.write(char.encode('ascii'))
-                time.sleep(0.05)  # 100 ms per character to avoid overflow
-            print(f"TX: {line}", end='')
-            time.sleep(0.2)  # 500 ms per line to avoid overflow
+            response = term.send_line(line, wozmon_ready(line))
+            if response is None:
+                failed += 1
+            elif response.strip():
+                # Print any response from the WozMon
+                print(f"RX: {response.decode('ascii', errors='ignore').strip()}")
+        end = time.time()
 
-            # Print any response from the WozMon
-            while ser.in_waiting > 0:
-                response = ser.read(ser.in_waiting).decode('ascii', errors='ignore')
-                print(f"RX: {response}", end='')
+        print(f"Sent {term.chars} characters in {end - start:.2f}s, "
+              f"{'echo paced' if term.echoing else 'fixed delays, no echo'}")
+        if failed:
+            print(f"Warning: WozMon did not get ready after {failed} lines.")
 
 if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("Usage: upload_a1.py <filename> [port] [baud]")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(description="Type WozMon lines into Apple-1, pacing by echo.")
+    parser.add_argument("file", help="WozMon lines (.mon), or binary file with --load")
+    parser.add_argument("port", nargs="?", default="/dev/ttyUSB0", help="Serial port (default: /dev/ttyUSB0)")
+    parser.add_argument("baud", nargs="?", type=int, default=250000, help="Baud rate (default: 250000)")
+    parser.add_argument("--load", help="File is binary, encode it for this load address (hex)")
+    parser.add_argument("--run", help="With --load, run address (hex), '-' for load address")
+    args = parser.parse_args()
 
-    file = sys.argv[1]
-    serial_port = "/dev/ttyUSB0" if len(sys.argv) < 3 else sys.argv[2]
-    baud_rate = 250000 if len(sys.argv) < 4 else int(sys.argv[3])
-    
     # Read input file
     try:
-        with open(file, "r") as f:
-            wozmon_lines = f.readlines()
+        if args.load:
+            load = parse_address(args.load)
+            run = None if args.run is None else load if args.run == "-" else parse_address(args.run)
+            with open(args.file, "rb") as f:
+                wozmon_lines = encode(f.read(), load, run)
+        else:
+            with open(args.file, "r") as f:
+                wozmon_lines = [line.rstrip("\r\n") for line in f if line.strip()]
     except FileNotFoundError:
-        print(f"Error: File {file} not found.")
+        print(f"Error: File {args.file} not found.")
+        sys.exit(1)
+    except ValueError as e:
+        print(f"Error: {e}")
         sys.exit(1)
 
     # Send data to serial
     try:
-        send_to_serial(serial_port, baud_rate, ["", ""] + wozmon_lines)
+        send_to_serial(args.port, args.baud, ["", ""] + wozmon_lines)
         print("Upload complete. Start address is ", wozmon_lines[0].split(':')[0])
     except serial.SerialException as e:
         print(f"Error: {e}")
         sys.exit(1)
-